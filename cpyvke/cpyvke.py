@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Wed Nov  9 10:03:04 2016
-# Last Modified : mar. 10 avril 2018 20:54:45 CEST
+# Last Modified : lun. 19 oct. 2026 01:37:20 CEST
 """
 -----------
 DOCSTRING
@@ -43,6 +43,7 @@ from .utils.config import cfg_setup
 from .utils.kernel import connect_kernel, print_kernel_list
 from .utils.kd import kd_status
 from .utils.sockets import SocketManager
+from .utils.trace import TRACER
 from .utils.term_colors import RED, RESET
 
 locale.setlocale(locale.LC_ALL, '')
@@ -89,8 +90,12 @@ def parse_args(lockfile, pidfile):
                         INTEGER is the id of the connection file. \
                         INTEGER can also be the keyword 'last' for 'last kernel'",
                         nargs='?')
+    parser.add_argument("--trace", help="Write the spans of the inspection requests \
+                        of cpyvke and kd5 to ~/.cpyvke/trace.json (Chrome trace format)",
+                        action="store_true")
 
     args = parser.parse_args()
+    trace = ' --trace' if args.trace else ''
 
     pid = kd_status(pidfile)
 
@@ -118,7 +123,7 @@ def parse_args(lockfile, pidfile):
 
     elif args.integer == 'last' and os.path.exists(lockfile):
         cmd = 'kd5 last'
-        cf = with_daemon(lockfile, pidfile, cmd)
+        cf = with_daemon(lockfile, pidfile, cmd + trace)
 
     elif args.integer:
         try:
@@ -129,11 +134,11 @@ def parse_args(lockfile, pidfile):
             sys.exit(1)
         else:
             cmd = 'kd5 start ' + str(args.integer)
-        cf = with_daemon(lockfile, pidfile, cmd)
+        cf = with_daemon(lockfile, pidfile, cmd + trace)
 
     else:
         cmd = 'kd5 start'
-        cf = with_daemon(lockfile, pidfile, cmd)
+        cf = with_daemon(lockfile, pidfile, cmd + trace)
 
     return args, cf
 
@@ -166,6 +171,10 @@ def main(args=None):
     # Parse arguments
     args, cf = parse_args(lockfile, pidfile)
 
+    # Tracing of the inspection requests
+    if args.trace or config['inspect']['trace'] == 'True':
+        TRACER.start(logdir + 'trace.json', 'cpyvke')
+
     # Init kernel
     km, kc = connect_kernel(cf)
 
@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Wed Nov 9 10:03:04 2016
-# Last Modified : lun. 09 avril 2018 22:51:37 CEST
+# Last Modified : dim. 18 oct. 2026 19:12:40 CEST
 """
 -----------
 DOCSTRING
@@ -36,7 +36,6 @@ import traceback
 import curses
 
 from cpyvke.utils.colors import Colors
-from cpyvke.utils.comm import send_msg
 from cpyvke.utils.display import str_reduce
 
 locale.setlocale(locale.LC_ALL, '')
@@ -289,7 +288,7 @@ class InitApp:
             print('Exiting ! Closing cpyvke...')
         elif self.close_signal == 'shutdown':
             print('Exiting ! Shutting down daemon...')
-            send_msg(self.sock.RequestSock, '<_stop>')
+            self.sock.stop_daemon()
 
         self.kc.stop_channels()
         self.sock.close_sockets()
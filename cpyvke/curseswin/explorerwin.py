@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Wed Nov 9 10:03:04 2016
-# Last Modified : ven. 30 mars 2018 17:28:02 CEST
+# Last Modified : lun. 19 oct. 2026 01:37:20 CEST
 """
 -----------
 DOCSTRING
@@ -33,10 +33,11 @@ import locale
 from curses import panel
 
 from cpyvke.curseswin.classwin import ClassWin
-from cpyvke.curseswin.widgets import Viewer
-from cpyvke.utils.display import whos_to_dic
-from cpyvke.utils.comm import recv_msg
-from cpyvke.utils.inspector import ProceedInspection, Inspect
+from cpyvke.curseswin.widgets import Viewer, FrameViewer
+from cpyvke.utils.kernel import set_kid
+from cpyvke.utils.display import format_summary
+from cpyvke.utils.inspector import ProceedInspection, Inspect, FramePager
+from cpyvke.utils.trace import TRACER
 from cpyvke.objects.panel import ListPanel
 
 
@@ -92,28 +93,11 @@ class ExplorerWin(ListPanel):
             self.sock.force_update(self.app.wng)
 
     def get_items(self):
-        """ Get variable from the daemon """
-
-        try:
-            tmp = recv_msg(self.sock.MainSock).decode('utf8')
-        except BlockingIOError:     # If no message !
-            pass
-        except OSError:             # If user disconnect cpyvke from socket
-            pass
-        except AttributeError:      # If kd5 is stopped
-            pass
-        else:
-            if tmp:
-                self.item_dic = whos_to_dic(tmp)
-                self.logger.info('Variable list updated')
-                self.logger.debug('\n%s', tmp)
-                try:
-                    # remove temporary file used by daemon from the list
-                    del self.item_dic['fcpyvke0']
-                except KeyError:
-                    pass
+        """ Get variable changes from the daemon """
 
-        return self.item_dic
+        self.sock.fetch_variables()
+
+        return self.sock.namespaces[set_kid(self.app.cf)].items
 
     def menu_special_init(self):
         """ Additionnal menu init """
@@ -126,19 +110,25 @@ class ExplorerWin(ListPanel):
         self.vartype = self.item_dic[self.item_keys[self.position]]['type']
         self.varval = self.item_dic[self.item_keys[self.position]]['value']
 
-        # Get Variable characteristics
-        proc = ProceedInspection(self.app, self.sock, self.logger,
-                                 self.varname, self.varval, self.vartype,
-                                 self.position, self.page)
-        self._ismenu, self.varname, self.varval, self.vartype, self.doc = proc.get_variable()
+        with TRACER.span('inspect', var=self.varname, type=self.vartype):
 
-        # Init all Inspectors
-        self.inspect = Inspect(self.sock, self.varval, self.varname, self.vartype)
-        self.class_win = ClassWin(self.app, self.sock, self.logger, self.varval, self.varname)
-        self.view = Viewer(self.app, self.varval, self.varname, self.vartype)
-        if self.doc:
-            self.view_doc = Viewer(self.app, self.doc, self.varname, self.vartype)
-            self.inspect_doc = Inspect(self.doc, self.varname, self.vartype, self.vartype)
+            # Get Variable characteristics
+            proc = ProceedInspection(self.app, self.sock, self.logger,
+                                     self.varname, self.varval, self.vartype,
+                                     self.position, self.page)
+            self._ismenu, self.varname, self.varval, self.vartype, self.doc = proc.get_variable()
+
+            # Init all Inspectors
+            with TRACER.span('render', var=self.varname):
+                self.inspect = Inspect(self.sock, self.varval, self.varname, self.vartype)
+                self.class_win = ClassWin(self.app, self.sock, self.logger, self.varval, self.varname)
+                if isinstance(self.varval, FramePager):
+                    self.view = FrameViewer(self.app, self.varval, self.varname)
+                else:
+                    self.view = Viewer(self.app, self.varval, self.varname, self.vartype)
+                if self.doc:
+                    self.view_doc = Viewer(self.app, self.doc, self.varname, self.vartype)
+                    self.inspect_doc = Inspect(self.doc, self.varname, self.vartype, self.vartype)
 
     def create_menu(self):
         """ Create the item list for the general menu. """
@@ -171,6 +161,7 @@ class ExplorerWin(ListPanel):
 
         elif (self.vartype == 'ndarray') and (len(self.varval.shape) == 1):
             return [('Less', "self.inspect.display('less')"),
+                    ('Summary', 'self.summary()'),
                     ('dataexplore',"self.inspect.display('dataexplore')"),
                     ('Plot', 'self.inspect.plot1D()'),
                     ('Save', 'self.menu_save()'),
@@ -178,6 +169,7 @@ class ExplorerWin(ListPanel):
 
         elif (self.vartype == 'ndarray') and (len(self.varval.shape) == 2):
             return [('Less', "self.inspect.display('less')"),
+                    ('Summary', 'self.summary()'),
                     ('dataexplore',"self.inspect.display('dataexplore')"),
                     ('Plot 2D', 'self.inspect.plot2D()'),
                     ('Plot (cols)', 'self.inspect.plot1Dcols()'),
@@ -187,6 +179,7 @@ class ExplorerWin(ListPanel):
 
         elif (self.vartype in ['DataFrame', 'Series']):
             return [('View', 'self.view.display()'),
+                    ('Summary', 'self.summary()'),
                     ('dataexplore',"self.inspect.display('dataexplore')"),
                     ('Less', "self.inspect.display('less')"),
                     ('Plot 2D', 'self.inspect.plot2D()'),
@@ -211,6 +204,18 @@ class ExplorerWin(ListPanel):
         else:
             return [('No Option', 'exit')]
 
+    def summary(self):
+        """ Display summary statistics computed by the kernel """
+
+        proc = ProceedInspection(self.app, self.sock, self.logger,
+                                 self.varname, self.varval, self.vartype,
+                                 self.position, self.page)
+        with TRACER.span('summary', var=self.varname):
+            summary = proc.get_summary()
+        if summary:
+            Viewer(self.app, '\n'.join(format_summary(summary)),
+                   self.varname, 'str').display()
+
     def item_save(self):
         """ Item save in menu """
 
@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Mon Nov 14 09:08:25 2016
-# Last Modified : ven. 30 mars 2018 17:28:23 CEST
+# Last Modified : dim. 18 oct. 2026 19:12:40 CEST
 """
 -----------
 DOCSTRING
@@ -34,7 +34,6 @@ import curses
 from cpyvke.utils.kernel import kernel_dic, start_new_kernel, \
     shutdown_kernel, connect_kernel, \
     async_shutdown_kernel
-from cpyvke.utils.comm import send_msg
 from cpyvke.objects.panel import ListPanel
 
 
@@ -78,8 +77,17 @@ class KernelWin(ListPanel):
         """ Get items ! """
 
         self.app.cf = self.app.kc.connection_file
+        kernels = kernel_dic(self.app.cf)
 
-        return kernel_dic(self.app.cf)
+        # Have all alive kernels watched by the daemon to get their variables
+        self.sock.fetch_variables()
+        for kid, kernel in kernels.items():
+            if kernel['type'] == 'Alive':
+                self.sock.watch_kernel(kernel['value'])
+            if kid in self.sock.namespaces and self.sock.namespaces[kid].version is not None:
+                kernel['count'] = len(self.sock.namespaces[kid].items)
+
+        return kernels
 
     def custom_key_bindings(self):
         """ Key actions """
@@ -130,7 +138,7 @@ class KernelWin(ListPanel):
         """ Connect to a kernel. """
 
         km, self.app.kc = connect_kernel(self.item_dic[self.selected]['value'])
-        send_msg(self.sock.RequestSock, '<cf>' + self.item_dic[self.selected]['value'])
+        self.sock.connect_kernel(self.item_dic[self.selected]['value'])
 
         # Update kernels connection file and set new kernel flag
         self.app.cf = self.app.kc.connection_file
@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Wed Nov 9 16:29:28 2016
-# Last Modified : mar. 03 avril 2018 21:15:01 CEST
+# Last Modified : lun. 19 oct. 2026 11:06:12 CEST
 """
 -----------
 DOCSTRING
@@ -77,6 +77,96 @@ class Viewer(PadWin):
         return dumped
 
 
+class FrameViewer:
+    """ Display a DataFrame/Series/Index (FramePager) : only the rows and
+    columns on screen are fetched from the kernel. """
+
+    # Width of the columns
+    width = 14
+
+    def __init__(self, app, pager, varname):
+
+        self.app = app
+        self.pager = pager
+        self.varname = varname
+
+    @property
+    def title(self):
+        return ' {} ({}) '.format(self.varname, self.pager)
+
+    def draw(self, win, col, ncols, index, data):
+        """ Draw the rows of the current page """
+
+        height, width = win.getmaxyx()
+        iwidth = min(max([len(i) for i in index] + [1]), self.width)
+        columns = self.pager.columns[col:col + ncols]
+        dtypes = self.pager.dtypes[col:col + ncols]
+
+        def line(y, first, cells, attr):
+            txt = first.ljust(iwidth)[:iwidth] + ' ' + \
+                ' '.join([c.rjust(self.width)[:self.width] for c in cells])
+            win.addnstr(y, 2, txt, width - 4, attr)
+
+        win.erase()
+        win.attrset(self.app.c_exp_bdr | curses.A_BOLD)
+        win.border(0)
+        win.addnstr(0, max(int((width - len(self.title))/2), 1), self.title, width - 2,
+                    self.app.c_exp_ttl | curses.A_BOLD)
+        line(1, '', columns, self.app.c_exp_ttl | curses.A_BOLD)
+        line(2, '', dtypes, self.app.c_exp_txt | curses.A_DIM)
+        for i, (idx, row) in enumerate(zip(index, data)):
+            line(3 + i, idx, row, self.app.c_exp_txt)
+        win.refresh()
+
+    def display(self):
+        """ Display the frame. Scroll with arrows, PgUp/PgDn, Home/End. """
+
+        height, width = self.app.screen_height - 2, self.app.screen_width - 2
+        win = curses.newwin(height, width, 1, 1)
+        win.keypad(1)
+        win.bkgd(self.app.c_exp_txt)
+
+        nrows = height - 4
+        ncols = max((width - 5 - self.width)//(self.width + 1), 1)
+        last_top = max(self.pager.rows - nrows, 0)
+        last_col = max(len(self.pager.columns) - ncols, 0)
+
+        pkey = -1
+        top, col = 0, 0
+        while pkey not in self.app.kquit:
+            # PgDn/PgUp are also in kright/kleft : test them first
+            if pkey == curses.KEY_NPAGE:
+                top = min(last_top, top + nrows)
+            elif pkey == curses.KEY_PPAGE:
+                top = max(0, top - nrows)
+            elif pkey in self.app.kdown:
+                top = min(last_top, top + 1)
+            elif pkey in self.app.kup:
+                top = max(0, top - 1)
+            elif pkey in self.app.kright:
+                col = min(last_col, col + 1)
+            elif pkey in self.app.kleft:
+                col = max(0, col - 1)
+            elif pkey == curses.KEY_HOME:
+                top = 0
+            elif pkey == curses.KEY_END:
+                top = last_top
+            elif pkey == curses.KEY_RESIZE:
+                break
+
+            try:
+                index, data = self.pager.get(top, min(top + nrows, self.pager.rows),
+                                             col, col + ncols)
+            except Exception as err:
+                self.app.wng.display(str(err))
+                break
+
+            self.draw(win, col, ncols, index, data)
+            pkey = win.getch()
+
+        win.erase()
+
+
 class WarningMsg:
     """ Display a message. """
 
@@ -139,7 +229,7 @@ class Help(PadWin):
                 '(:) Prompt access',
                 '(/) Search a pattern',
                 '(n) Next occurence of pattern',
-                '(s) Sort by name/type',
+                '(s) Sort by name/type/size',
                 '(f) filter',
                 '(x) Execute code in current IPython kernel',
                 '(u) Undo limit',
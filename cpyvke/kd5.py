@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Fri Nov  4 21:49:15 2016
-# Last Modified : lun. 09 avril 2018 21:32:29 CEST
+# Last Modified : lun. 19 oct. 2026 11:58:44 CEST
 """
 -----------
 DOCSTRING
@@ -30,300 +30,449 @@ DOCSTRING
 
 import os
 import sys
-import threading
-import socket
+import json
+import signal
+import asyncio
+import time
+import uuid
 import argparse
 import logging
+from collections import OrderedDict
 import psutil
-from time import sleep
-from queue import Queue
 from logging.handlers import RotatingFileHandler
 from jupyter_client import find_connection_file
 
-from .utils.kernel import init_kernel, connect_kernel, print_kernel_list, \
+from .utils.kernel import init_kernel, async_connect_kernel, print_kernel_list, \
     start_new_kernel, set_kid
 from .utils.kd import is_kd_running, find_lost_pid, kdwrite, kdread
-from .utils.comm import send_msg, recv_msg
+from .utils import comm
+from .utils.comm import pack_frame, async_recv_frame, socket_path, choose_codec, ProtocolError
+from .utils.namespace import namespace_delta, is_empty, full_msg, delta_msg
+from .utils.metrics import Registry, SIZE_BUCKETS
+from .utils.trace import TRACER
 from .utils.daemon3x import Daemon
 from .utils.config import cfg_setup
 from .utils.term_colors import RED, BLUE, CYAN, RESET
 
 logger = logging.getLogger('kd5')
 
-
-class Watcher(threading.Thread):
-    """
-    Daemon : watch the kernel input and update variable list.
-    The client may also request for the content of a variable.
+# Unsent bytes allowed for a stream client before holding back its changes
+MAX_BACKLOG = 1024*1024
+
+# Time (s) given to a stream client to announce its codecs (HELLO) before
+# it is sent the snapshots
+HELLO_DELAY = 0.2
+
+# Metrics (Prometheus text format, see Watcher.handle_metrics)
+METRICS = Registry()
+IOPUB_MESSAGES = METRICS.counter('kd5_iopub_messages_total',
+                                 'Messages read from the iopub channel of kernels', ['kernel'])
+WHOS_SECONDS = METRICS.histogram('kd5_whos_seconds',
+                                 'Time taken to poll the variable list of a kernel', ['kernel'])
+ROUNDTRIP_SECONDS = METRICS.histogram('kd5_kernel_roundtrip_seconds',
+                                      'Time from sending code to a kernel to its completion',
+                                      ['kernel'])
+REQUESTS = METRICS.counter('kd5_requests_total', 'Requests received from clients', ['type'])
+CACHE_HITS = METRICS.counter('kd5_cache_hits_total', 'Code requests answered from the cache')
+NAMESPACE_BYTES = METRICS.histogram('kd5_namespace_frame_bytes',
+                                    'Size of the namespace frames sent to stream clients',
+                                    ['kind'], SIZE_BUCKETS)
+SENT_BYTES = METRICS.counter('kd5_sent_bytes_total', 'Bytes sent to clients', ['socket'])
+
+REQUEST_TYPES = {comm.CODE: 'code', comm.CONNECT: 'connect', comm.WATCH: 'watch',
+                 comm.SYNC: 'sync', comm.CANCEL: 'cancel', comm.STOP: 'stop',
+                 comm.HELLO: 'hello'}
+
+
+class Subscriber:
+    """ Client connected to the stream socket. Frames that cannot be sent
+    right away are buffered by the transport until the socket is writable
+    again.
+
+    Beyond MAX_BACKLOG unsent bytes, the client is lagging : the changes it
+    is sent are held back, only the kernels they concern are remembered
+    (**stale**). Once it has drained its stream, it is sent the latest
+    snapshot of these kernels, so that newer changes replace older unsent
+    ones instead of piling up.
     """
 
-    def __init__(self, kc, delay=0.1, sport=15557, rport=15556):
-        """ Class constructor """
+    def __init__(self, writer):
 
-        logger.info('++++++++++++++++++++++++++++')
-        logger.info('Initialize Watcher')
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.codec = None
+        self.stale = set()
+        self.catching_up = None
+        # Writing is paused above MAX_BACKLOG and resumed below MAX_BACKLOG/4
+        writer.transport.set_write_buffer_limits(high=MAX_BACKLOG)
 
-        # Init Thread
-        threading.Thread.__init__(self)
-        threading.Thread.daemon = True
+    def push(self, kid, frame):
+        """ Queue **frame** about kernel **kid**. Sent as soon as possible by
+        the event loop. Return False (and hold it back) if lagging """
 
-        logger.info('Watcher sent to thread')
+        if self.stale or self.lagging:
+            self.stale.add(kid)
+            return False
 
-        # Events
-        self._stop = threading.Event()
-        self._pause = threading.Event()
-        logger.info('Events created')
+        self.writer.write(frame)
+        SENT_BYTES.inc(len(frame), socket='stream')
+        return True
 
-        # Inputs
-        self.kc = kc
-        self.delay = delay
+    @property
+    def closed(self):
 
-        # Queue
-        self.kernel_queue = Queue()
-        logger.info('Queue created')
+        return self.writer.is_closing()
 
+    @property
+    def lagging(self):
+        """ True if the client does not read its stream """
 
-        # Init Main Socket
-        try:
-            self.MainSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.MainSock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.MainSock.bind(('', sport))
-            self.MainSock.listen(5)
-            self.MainSock.setblocking(0)
-            self.client_main = None
-            logger.info('Main socket created')
-        except Exception as e:
-            logger.info(e)
-            logger.info('Exiting...')
-            sys.exit(1)
+        return self.writer.transport.get_write_buffer_size() > MAX_BACKLOG
 
-        # Init Request Socket
-        try:
-            self.RequestSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.RequestSock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.RequestSock.bind(('', rport))
-            self.RequestSock.listen(5)
-            self.RequestSock.setblocking(0)
-            self.client_request = None
-            logger.info('Request socket created')
-        except Exception as e:
-            logger.info(e)
-            logger.info('Exiting...')
-            sys.exit(1)
+    def receive(self, frame):
+        """ Handle a frame sent by the client : codecs it can read (HELLO) or
+        heartbeat (PING). Others are discarded. """
 
+        if frame is None:
+            return
 
-        logger.info('++++++++++++++++++++++++++++')
-        logger.info('Daemon started !')
-        logger.info('Delay set to {} s.'.format(self.delay))
-        logger.info('Kernel : {}'.format(self.kc.connection_file))
-        logger.info('Streaming on {}'.format(sport))
-        logger.info('Listening on {}'.format(rport))
-        logger.info('++++++++++++++++++++++++++++')
+        if frame.type == comm.HELLO:
+            self.codec = choose_codec(frame.body.get('codecs', []))
+            logger.info('{} reads {} frames'.format(self.address, self.codec))
 
-        # Init variables
-        self.msg = 0
-        self.check_input()
-        self.variables = ''
+        elif frame.type == comm.PING:
+            self.writer.write(pack_frame(comm.PONG))
 
-    def run(self):
-        """ Run the variable explorer daemon """
+    def close(self):
+        """ Disconnect the client. Unsent changes are discarded (a client that
+        does not read would otherwise never be disconnected) """
 
-        # Launch streamer
-        streamer = threading.Thread(target=self.stream_data)
-        streamer.start()
+        if self.catching_up is not None:
+            self.catching_up.cancel()
+        self.writer.transport.abort()
 
-        while True:
 
-            # Look for connection to request socket
-            self.listen_request_sock()
+class PreviewCache:
+    """ Replies to the inspection of variables, by kernel, variable and code.
 
-            # Watch RequestSock for code request OR kernel changes
-            if self.client_request:
-                self.fetch_request()
+    A variable is identified by its entry in the snapshot (identity of the
+    object, type, shape, fingerprint...) : a reply about an object that was
+    rebound or changed is never served, and is dropped as soon as the change
+    is notified. Only arrays and frames hashed in full are cached : the
+    preview of other objects (instances, containers) and a sampled fingerprint
+    (ending with '~') do not tell whether their content changed. Least
+    recently used replies are dropped beyond **size** bytes.
+    """
 
-            # Terminate daemon
-            if self._stop.isSet():
-                logger.info('Request Socket closed !')
-                break
+    def __init__(self, size):
 
-            sleep(self.delay)
+        self.size = size
+        self.used = 0
+        self.items = OrderedDict()
 
-        streamer.join()
-        # Close connection to clients
-        self.MainSock.shutdown()
-        self.RequestSock.shutdown()
-        # Destroy socket
-        self.MainSock.close()
-        self.RequestSock.close()
-        logger.info('Exited')
+    @staticmethod
+    def key(watch, name, code):
+        """ Key of **code** inspecting **name** (None if it cannot be cached) """
 
-    def stream_data(self):
-        """ Stream 'whos' output to client. """
+        entry = watch.snapshot.get(name) if name else None
+        if entry is None or entry.get('fp') is None or entry['fp'].endswith('~'):
+            return None
 
-        while True:
+        return watch.kid, name, json.dumps(entry, sort_keys=True), code
 
-            # Pause if client has a request
-            self.pause()
+    def get(self, key):
+        """ Reply kept for **key** (None if none) """
 
-#            # Check if reset has been invoked
-#            if 'empty' in self.variables:
-#                init_kernel(self.kc)
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
 
-            # Look for connection to main socket
-            self.listen_main_sock()
+    def put(self, key, value):
+        """ Keep a reply """
 
-            # Listen to kernel changes
-            if self.kernel_queue.qsize() > 0:
-                self.kernel_change(self.kernel_queue.get())
+        if key is None or value is None or len(value) > self.size:
+            return
 
-            # Check in new entries in kernel
-            self.check_input()
+        self.discard(key)
+        self.items[key] = value
+        self.used += len(value)
+        while self.used > self.size:
+            _, old = self.items.popitem(last=False)
+            self.used -= len(old)
 
-            # If new entries, update variables
-            if self.msg == 1:
-                self.send_variables()
+    def discard(self, key):
 
-            # Terminate daemon
-            if self._stop.isSet():
-                logger.info('Stream Socket closed !')
-                break
+        if key in self.items:
+            self.used -= len(self.items.pop(key))
 
-            sleep(self.delay)
+    def invalidate(self, kid, names=None):
+        """ Drop the replies about **names** (all by default) of kernel **kid** """
 
-    def pause(self):
-        """ Pause streamer when client has a request. """
+        for key in [k for k in self.items if k[0] == kid and (names is None or k[1] in names)]:
+            self.discard(key)
 
-        if self._pause.isSet():
 
-            logger.debug('Streamer paused...')
+class KernelWatch:
+    """ State of a kernel watched by kd5 : client, last snapshot of the
+    namespace and pending executions.
 
-            while self._pause.isSet():
-                sleep(self.delay)
+    Changes are pushed by the kernel through the 'cpyvke' Comm (see
+    inspector.Notifier). If the Comm cannot be opened, the namespace is
+    polled with _inspect.whos_json() when the kernel goes idle.
+    """
 
-            logger.debug('Streamer active')
+    def __init__(self, kc, on_change, interval=0.5, timeout=10, interrupt=True):
 
-            # Force Update var list
-            self.send_variables()
+        self.kc = kc
+        self.kid = set_kid(kc.connection_file)
+        self.on_change = on_change
+        self.interval = interval
+        self.timeout = timeout
+        self.interrupt = interrupt
+
+        self.last_refresh = 0
+        self.refresher = None
+        self.executing = set()
+        self.pending = {}
+        self.comm_id = None
+        self.variables = ''
+        self.snapshot = {}
+        self.version = 0
 
-    def check_input(self):
-        """ Check the iopub msgs available """
+        self.listener = asyncio.ensure_future(self.listen())
+        self.open_comm()
 
-        self.msg = 0
-        while self.kc.iopub_channel.msg_ready():
-            data = self.kc.get_iopub_msg(timeout=0.1)
-            logger.debug('WATCHING : {}'.format(self.disp_data(data)))
-            self.msg = 1
-            self.check_init(data)
+    async def listen(self):
+        """ Handle all the messages of the iopub channel """
 
-    def check_init(self, data):
-        if 'code' in data['content'].keys():
-            if 'reset' in data['content']['code']:
-                init_kernel(self.kc)
-                logger.debug('RESET RECEIVED : {}'.format('Init Kernel'))
+        while True:
+            data = await self.kc.get_iopub_msg()
+            IOPUB_MESSAGES.inc(kernel=self.kid)
+            try:
+                logger.debug('WATCHING {} : {}'.format(self.kid, self.disp_data(data)))
+                self.dispatch(data)
+            except Exception:
+                logger.error('Cannot handle message from {} :'.format(self.kid), exc_info=True)
 
-    def execute(self, code):
-        """ Execute **code** """
+    def dispatch(self, data):
+        """ Handle a message from iopub """
 
-        value = None
-        MSG_RECEIVED = False
+        self.check_comm(data)
+        self.check_init(data)
+        self.check_refresh(data)
+        self.check_pending(data)
 
-        msg_id = self.kc.execute(code, store_history=False)
-        logger.debug("EXEC : '{}' sent with id {}".format(code, msg_id.split('-')[0]))
+    def close(self):
+        """ Stop watching the kernel """
 
-        while not MSG_RECEIVED:
-            self.wait_msg()
+        self.close_comm()
+        self.listener.cancel()
+        if self.refresher:
+            self.refresher.cancel()
+        self.kc.stop_channels()
 
-            while self.kc.iopub_channel.msg_ready():
-                data = self.kc.get_iopub_msg()
-                if data['parent_header']['msg_id'] != msg_id:
-                    logger.debug('EXEC : PASS MSG : {}'.format(self.disp_data(data)))
-                    self.check_init(data)
-                    continue
-                else:
-                    MSG_RECEIVED = True
-                    logger.debug('EXEC : PROCEED MSG : {}'.format(self.disp_data(data)))
-                    if data['header']['msg_type'] == 'stream':
-                        value = data['content']['text']
+    def open_comm(self):
+        """ Ask the kernel to push the namespace changes """
 
-        logger.debug('EXEC : RESULT :\n {}'.format(value))
-        self.msg = 0
+        self.comm_id = uuid.uuid4().hex
+        self.comm_version = None
+        self.send_comm('comm_open', {'target_name': 'cpyvke', 'data': {}})
 
-        return value
+    def close_comm(self):
 
-    def wait_msg(self):
-        """ Waiting for message from iopub channel """
+        if self.comm_id:
+            self.send_comm('comm_close', {'data': {}})
+            self.comm_id = None
 
-        while not self.kc.iopub_channel.msg_ready():  # To fix.Have to wait
-            sleep(self.delay)
+    def send_comm(self, msg_type, content):
+        """ Send a comm message to the kernel (shell channel) """
 
-    def listen_main_sock(self):
-        """ Look for client connection to main socket. """
+        content = dict(content, comm_id=self.comm_id)
+        self.kc.shell_channel.send(self.kc.session.msg(msg_type, content))
 
-        try:
-            self.client_main, address = self.MainSock.accept()
-            logger.info("{} connected to main socket".format(address))
-        except BlockingIOError:
-            pass
-        else:
-            send_msg(self.client_main, self.variables)
+    def check_comm(self, data):
+        """ Apply the changes pushed by the kernel """
+
+        if data['content'].get('comm_id') != self.comm_id or self.comm_id is None:
+            return
+
+        if data['msg_type'] == 'comm_close':
+            logger.info('Comm closed by {} : polling variables'.format(self.kid))
+            self.comm_id = None
+            self.schedule_refresh()
+
+        elif data['msg_type'] == 'comm_msg':
+            msg = data['content']['data']
+
+            if 'full' in msg:
+                self.apply(namespace_delta(self.snapshot, msg['full']))
+
+            elif self.comm_version is not None and msg['version'] == self.comm_version + 1:
+                self.apply(msg)
+
+            else:
+                logger.info('Lost changes from {} : asking for a sync'.format(self.kid))
+                self.send_comm('comm_msg', {'data': {'sync': True}})
+                return
+
+            self.comm_version = msg['version']
+
+    def check_refresh(self, data):
+        """ Ask for a refresh when the kernel goes idle after executing code
+        sent by another client. Other messages (stream, ...) are ignored.
+        Only used if the kernel does not push its changes. """
+
+        parent = data['parent_header']
+        if parent.get('session') == self.kc.session.session or self.comm_id:
+            return
+
+        if data['msg_type'] == 'execute_input':
+            self.executing.add(parent.get('msg_id'))
 
-    def listen_request_sock(self):
-        """ Look for client connection to request socket. """
+        elif data['msg_type'] == 'status' and \
+                data['content']['execution_state'] == 'idle' and \
+                parent.get('msg_id') in self.executing:
+            self.executing.discard(parent.get('msg_id'))
+            self.schedule_refresh()
 
+    def check_init(self, data):
+        if 'code' in data['content'].keys():
+            if 'reset' in data['content']['code']:
+                init_kernel(self.kc)
+                logger.debug('RESET RECEIVED : {}'.format('Init Kernel'))
+
+    def check_pending(self, data):
+        """ Collect the output of the code executed by kd5 """
+
+        pending = self.pending.get(data['parent_header'].get('msg_id'))
+        if pending is None:
+            return
+
+        logger.debug('EXEC : PROCEED MSG : {}'.format(self.disp_data(data)))
+        if data['msg_type'] == 'stream' and data['content']['name'] == 'stdout':
+            pending['value'] = (pending['value'] or '') + data['content']['text']
+        elif data['msg_type'] == 'stream':
+            # Warnings... would break the output parsed by the client
+            logger.info('EXEC : {} : {}'.format(data['content']['name'], data['content']['text']))
+        elif data['msg_type'] == 'error':
+            pending['error'] = '{ename}: {evalue}'.format(**data['content'])
+        elif data['msg_type'] == 'status' and \
+                data['content']['execution_state'] == 'busy':
+            pending['running'] = True
+        elif data['msg_type'] == 'status' and \
+                data['content']['execution_state'] == 'idle':
+            self.pending.pop(data['parent_header']['msg_id'])
+            ROUNDTRIP_SECONDS.observe(time.time() - pending['sent'], kernel=self.kid)
+            logger.debug('EXEC : RESULT :\n {}'.format(pending['value']))
+            pending['done'].set_result(pending)
+
+    def submit(self, code):
+        """ Send **code** to the kernel without waiting. Return its msg_id """
+
+        msg_id = self.kc.execute(code, store_history=False, stop_on_error=False)
+        logger.debug("EXEC {} : '{}' sent with id {}".format(self.kid, code, msg_id.split('-')[0]))
+
+        done = asyncio.get_event_loop().create_future()
+        self.pending[msg_id] = {'value': None, 'error': None, 'running': False, 'done': done,
+                                'sent': time.time()}
+
+        return msg_id
+
+    async def wait(self, msg_id, timeout=None):
+        """ Wait for the output (value, error) of code **msg_id**, at most
+        **timeout** seconds (default timeout of the daemon). """
+
+        pending = self.pending[msg_id]
         try:
-            self.client_request, address = self.RequestSock.accept()
-            logger.info("{} connected to request socket".format(address))
-        except BlockingIOError:
-            pass
+            return await asyncio.wait_for(asyncio.shield(pending['done']),
+                                          timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.abort(msg_id)
+            error = 'Timeout: no answer from kernel {} after {} s.'.format(self.kid, timeout or self.timeout)
+            logger.error(error)
+            return dict(pending, error=error)
+        except asyncio.CancelledError:
+            self.abort(msg_id)
+            raise
 
-    def check_variables(self):
-        """ If variables is None, ask again to kernel """
-        if not self.variables:
-            logger.debug("EXEC : 'variables' is None : RUN AGAIN 'whos'")
-        while not self.variables:
-            self.variables = self.execute('whos')
+    def abort(self, msg_id):
+        """ Stop waiting for code **msg_id**. Interrupt the kernel if it is
+        running this code (and not some code of the user). """
 
-    def kernel_change(self, cf):
-        """ Watch kernel changes """
+        pending = self.pending.pop(msg_id, None)
+        if pending and pending['running'] and self.interrupt:
+            logger.info('Interrupting kernel {}'.format(self.kid))
+            self.kc.control_channel.send(self.kc.session.msg('interrupt_request', {}))
 
-        old_id = set_kid(self.kc.connection_file)
-        _, self.kc = connect_kernel(cf)
-        new_id = set_kid(self.kc.connection_file)
+    async def execute(self, code, timeout=None):
+        """ Execute **code** and wait for the kernel to be idle again """
 
-        # Update kd5.lock files
-        self.update_lockfile(new_id)
-        logger.info('Kernel change from {} to {}'.format(old_id, new_id))
+        return (await self.wait(self.submit(code), timeout))['value']
 
-        # Force kernel update
-        self.send_variables()
+    def schedule_refresh(self):
+        """ Refresh the variable list, at most once per interval """
 
-    def update_lockfile(self, new_id):
-        """ Update lock files """
+        if self.refresher is None or self.refresher.done():
+            self.refresher = asyncio.ensure_future(self.refresh())
 
-        LogDir = os.path.expanduser("~") + "/.cpyvke/"
+    async def check_variables(self, output):
+        """ If _inspect is missing, init kernel and ask again """
 
-        with open(LogDir + 'kd5.lock', 'w') as f:
-            f.write(new_id)
+        if output['error'] and output['error'].startswith('NameError'):
+            logger.debug("EXEC : '_inspect' is missing : INIT KERNEL AND RUN AGAIN")
+            init_kernel(self.kc)
+            output = await self.wait(self.submit('_inspect.whos_json()'))
 
-    def send_variables(self):
-        """ Send variable to client """
+        return output
 
-        self.variables = self.execute('whos')
-        self.check_variables()
-        # Send to client
-        if self.client_main:
-            try:
-                send_msg(self.client_main, self.variables)
-            except BlockingIOError:
-                logger.info("Client is disconnected from main socket!")
-                self.client_main = None
-            else:
-                logger.info('Variable list sent to client')
+    async def refresh(self):
+        """ Poll the namespace and update the snapshot """
+
+        await asyncio.sleep(max(0, self.last_refresh + self.interval - time.time()))
+
+        self.last_refresh = time.time()
+        output = await self.wait(self.submit('_inspect.whos_json()'))
+        output = await self.check_variables(output)
+        WHOS_SECONDS.observe(time.time() - self.last_refresh, kernel=self.kid)
+        TRACER.complete('whos', self.last_refresh, kernel=self.kid)
+        if output['error']:
+            logger.error('Cannot refresh variable list of {} : {}'.format(self.kid, output['error']))
+            return
+
+        self.variables = output['value']
+
+        try:
+            snapshot = json.loads(self.variables)
+        except (TypeError, ValueError):
+            logger.error('Cannot read variable list of {} : {}'.format(self.kid, self.variables))
+            return
+
+        self.apply(namespace_delta(self.snapshot, snapshot))
+
+    def apply(self, delta):
+        """ Update the snapshot and send the message to the clients """
+
+        # The first snapshot is always sent, even if empty
+        if is_empty(delta) and self.version:
+            logger.debug('Variable list of {} unchanged'.format(self.kid))
+            return
+
+        for name in delta['removed']:
+            self.snapshot.pop(name, None)
+        self.snapshot.update(delta['added'])
+        self.snapshot.update(delta['changed'])
+        self.version += 1
+
+        # Clients may not know this kernel yet if it is new
+        if self.version == 1:
+            self.on_change(self, full_msg(self.kid, self.version, self.snapshot))
+        else:
+            self.on_change(self, delta_msg(self.kid, self.version, delta))
 
     @staticmethod
     def disp_id(data):
         """ Display first seq of message id only """
-        return data['parent_header']['msg_id'].split('-')[0]
+        return data['parent_header'].get('msg_id', '').split('-')[0]
 
     @classmethod
     def disp_data(cls, data):
@@ -339,40 +488,456 @@ class Watcher(threading.Thread):
             dbg = '{} {}'.format(cls.disp_id(data), data['msg_type'])
         return dbg
 
-    def fetch_request(self):
-        """ Listen to sock request :
-            handle kernel changes | exec code | stop signal. """
+
+class Watcher:
+    """
+    Daemon : watch the kernels input and update variable lists.
+    The client may also request for the content of a variable.
+
+    Everything runs in a single asyncio event loop : one listener per
+    kernel and one coroutine per connected client.
+    """
+
+    def __init__(self, cf, sport=15557, rport=15556, interval=0.5,
+                 timeout=10, interrupt=True, transport='tcp', cache_size=64*1024**2,
+                 threshold=4096, metrics_port=0):
+        """ Class constructor """
+
+        logger.info('++++++++++++++++++++++++++++')
+        logger.info('Initialize Watcher')
+
+        # Inputs
+        self.cf = cf
+        self.interval = interval
+        self.timeout = timeout
+        self.interrupt = interrupt
+        self.sport = sport
+        self.rport = rport
+        self.transport = transport
+        self.threshold = threshold
+        self.metrics_port = metrics_port
+
+        # Clients
+        self.subscribers = []
+        self.current = {}
+        self.codecs = {}
+        self.handlers = set()
+        self.requests = {}
+        self.cache = PreviewCache(cache_size)
+
+        # Metrics read from the current state
+        self.gauges = Registry()
+        self.gauges.gauge('kd5_clients', 'Connected clients', self.client_count, ['socket'])
+        self.gauges.gauge('kd5_lagging_clients', 'Stream clients catching up',
+                          lambda: sum(1 for sub in self.subscribers if sub.stale))
+        self.gauges.gauge('kd5_pending_executions', 'Code sent to a kernel and not completed yet',
+                          lambda: {kid: len(watch.pending) for kid, watch in self.kernels.items()},
+                          ['kernel'])
+        self.gauges.gauge('kd5_cache_bytes', 'Size of the replies kept in cache',
+                          lambda: self.cache.used)
+
+        # Watched kernels, by kernel id. Requests from a client apply to the
+        # kernel it is connected to (default is the last connected kernel).
+        self.kernels = {}
+        self.kid = set_kid(cf)
+
+    def run(self):
+        """ Run the variable explorer daemon until a stop request. """
+
+        asyncio.run(self.serve())
+        logger.info('Exited')
+
+    async def serve(self):
+        """ Start the servers and watch the first kernel """
+
+        self._quit = asyncio.Event()
+
+        # kd5 stop|restart : clean up before exiting
+        try:
+            asyncio.get_event_loop().add_signal_handler(signal.SIGTERM, self.stop)
+        except (ValueError, RuntimeError):
+            pass            # Not run in the main thread
+
+        try:
+            self.MainSock = await self.start_server(self.handle_subscriber, 'stream', self.sport)
+            logger.info('Main socket created')
+            self.RequestSock = await self.start_server(self.handle_requester, 'request', self.rport)
+            logger.info('Request socket created')
+            self.MetricsSock = None
+            if self.metrics_port:
+                self.MetricsSock = await self.start_server(self.handle_metrics, 'metrics',
+                                                           self.metrics_port)
+                logger.info('Metrics socket created')
+        except Exception as e:
+            logger.info(e)
+            logger.info('Exiting...')
+            sys.exit(1)
+
+        await self.watch_kernel(self.cf)
+
+        logger.info('++++++++++++++++++++++++++++')
+        logger.info('Daemon started !')
+        logger.info('Min. refresh interval set to {} s.'.format(self.interval))
+        logger.info('Timeout set to {} s.'.format(self.timeout))
+        logger.info('Kernel : {}'.format(self.cf))
+        if self.transport == 'unix':
+            logger.info('Streaming on {}'.format(socket_path('stream')))
+            logger.info('Listening on {}'.format(socket_path('request')))
+        else:
+            logger.info('Streaming on {}'.format(self.sport))
+            logger.info('Listening on {}'.format(self.rport))
+        logger.info('++++++++++++++++++++++++++++')
+
+        await self._quit.wait()
+
+        # Stop notifications from kernels
+        for watch in self.kernels.values():
+            watch.close()
+
+        # Close connection to clients
+        self.MainSock.close()
+        self.RequestSock.close()
+        if self.MetricsSock:
+            self.MetricsSock.close()
+        for sub in self.subscribers:
+            sub.close()
+        for client in self.current:
+            client.close()
+        if self.handlers:
+            await asyncio.wait(self.handlers, timeout=1)
+        if self.transport == 'unix':
+            for name in ('stream', 'request', 'metrics'):
+                if name != 'metrics' or self.MetricsSock:
+                    os.remove(socket_path(name))
+        logger.info('Stream Socket closed !')
+        logger.info('Request Socket closed !')
+
+    async def start_server(self, handler, name, port):
+        """ Listen on localhost:**port**, or on a Unix domain socket only
+        accessible to the user if transport is 'unix' """
+
+        if self.transport != 'unix':
+            return await asyncio.start_server(handler, host='localhost', port=port,
+                                              reuse_address=True)
+
+        path = socket_path(name)
+        if os.path.exists(path):
+            os.remove(path)
+        # Created with the right mode : never open to other users, even briefly
+        umask = os.umask(0o077)
+        try:
+            return await asyncio.start_unix_server(handler, path=path)
+        finally:
+            os.umask(umask)
+
+    async def watch_kernel(self, cf):
+        """ Return the watch of kernel **cf**. Connect it if necessary. """
+
+        kid = set_kid(cf)
+        if kid not in self.kernels:
+            _, kc = await async_connect_kernel(cf)
+            self.kernels[kid] = KernelWatch(kc, self.send_variables,
+                                            interval=self.interval,
+                                            timeout=self.timeout,
+                                            interrupt=self.interrupt)
+            logger.info('Watching kernel {} ({} kernel(s))'.format(kid, len(self.kernels)))
+
+        return self.kernels[kid]
+
+    def client_count(self):
+        """ Number of clients connected to each socket """
+
+        return {'stream': len(self.subscribers), 'request': len(self.current)}
+
+    def client_kernel(self, client):
+        """ Kernel a request client is connected to """
+
+        return self.kernels[self.current.get(client, self.kid)]
+
+    async def handle_subscriber(self, reader, writer):
+        """ Stream client : send it all the snapshots, then the changes.
+        What it sends is discarded, except HELLO and PING frames. """
+
+        self.handlers.add(asyncio.current_task())
+        sub = Subscriber(writer)
+        logger.info("{} connected to main socket".format(sub.address))
+
+        first = asyncio.ensure_future(async_recv_frame(reader))
+        await asyncio.wait([first], timeout=HELLO_DELAY)
+        early = first.done() and not first.exception()
+        if early:
+            sub.receive(first.result())
+
+        self.subscribers.append(sub)
+        for watch in self.kernels.values():
+            self.publish(full_msg(watch.kid, watch.version, watch.snapshot), [sub])
 
         try:
-            tmp = recv_msg(self.client_request).decode('utf8')
-        except AttributeError:
-            tmp = None
-            self.client_request = None
+            frame = await first
+            if not early:
+                sub.receive(frame)
+            while frame is not None:
+                frame = await async_recv_frame(reader)
+                sub.receive(frame)
+        except (OSError, ProtocolError):
+            pass
+
+        self.drop_subscriber(sub)
+        self.handlers.discard(asyncio.current_task())
+
+    async def handle_requester(self, reader, writer):
+        """ Request client : requests are handled in order, but code is sent
+        to the kernel without waiting for the previous one to complete. """
+
+        self.handlers.add(asyncio.current_task())
+        logger.info("{} connected to request socket".format(writer.get_extra_info('peername')))
+        self.current[writer] = self.kid
+
+        try:
+            while not self._quit.is_set():
+                try:
+                    frame = await async_recv_frame(reader)
+                except OSError:
+                    frame = None
+                except ProtocolError as err:
+                    logger.error('Request socket : {}'.format(err))
+                    frame = None
+                if frame is None:
+                    break
+                with TRACER.span('request', rid=frame.id, type=REQUEST_TYPES.get(frame.type)):
+                    try:
+                        await self.fetch_request(writer, frame)
+                    except Exception as err:
+                        logger.error('Request failed : {}'.format(err), exc_info=True)
+                        self.reply(writer, frame.id or None,
+                                   error='{}: {}'.format(type(err).__name__, err))
+        finally:
+            self.current.pop(writer, None)
+            self.codecs.pop(writer, None)
+            writer.close()
             logger.info("Client is disconnected from request socket!")
+            self.handlers.discard(asyncio.current_task())
+
+    def drop_subscriber(self, sub):
+        """ Remove a stream client. """
+
+        if sub in self.subscribers:
+            logger.info("{} is disconnected from main socket!".format(sub.address))
+            self.subscribers.remove(sub)
+            sub.close()
+
+    def publish(self, msg, subscribers=None):
+        """ Send a namespace message (serialized once per codec) to all stream
+        clients. Dead clients are dropped, lagging ones catch up later : none
+        of them stalls the others. """
+
+        frames = {}
+        for sub in list(subscribers or self.subscribers):
+            if sub.closed:
+                self.drop_subscriber(sub)
+                continue
+
+            if sub.stale or sub.lagging:
+                frame = None
+            elif sub.codec not in frames:
+                frame = frames[sub.codec] = pack_frame(comm.NAMESPACE, msg, codec=sub.codec,
+                                                       threshold=self.threshold)
+                NAMESPACE_BYTES.observe(len(frame), kind='full' if 'full' in msg else 'delta')
+            else:
+                frame = frames[sub.codec]
 
-        if tmp:
-            self._pause.set()
-            sleep(self.delay)
-            logger.info('Request from client')
-            logger.debug('RECEIVED :\n {}'.format(tmp))
+            if not sub.push(msg['kernel'], frame) and sub.catching_up is None:
+                logger.info("{} is lagging behind !".format(sub.address))
+                sub.catching_up = asyncio.ensure_future(self.catch_up(sub))
 
-            if '<cf>' in tmp:
-                cf = tmp.split('<cf>')[1]
-                self.kernel_queue.put(cf)           # Send new k to streamer
+    async def catch_up(self, sub):
+        """ Send a lagging stream client the latest snapshot of the kernels it
+        missed, once it has drained its stream. """
 
-            elif '<_stop>' in tmp:
-                self.stop()
+        try:
+            while sub.stale:
+                await sub.writer.drain()
+                while sub.stale and not sub.lagging:
+                    watch = self.kernels[sub.stale.pop()]
+                    frame = pack_frame(comm.NAMESPACE, full_msg(watch.kid, watch.version, watch.snapshot),
+                                       codec=sub.codec, threshold=self.threshold)
+                    NAMESPACE_BYTES.observe(len(frame), kind='full')
+                    SENT_BYTES.inc(len(frame), socket='stream')
+                    sub.writer.write(frame)
+                    logger.info('{} caught up with v{} of {}'.format(sub.address, watch.version,
+                                                                     watch.kid))
+        except OSError:
+            self.drop_subscriber(sub)
+        finally:
+            sub.catching_up = None
 
-            elif '<code>' in tmp:
-                self.execute(tmp.split('<code>')[1])
+    async def kernel_change(self, cf, client):
+        """ Switch the kernel a client is connected to. Other kernels
+        remain watched. """
 
-            self._pause.clear()
+        old_id = self.client_kernel(client).kid
+        new_id = (await self.watch_kernel(cf)).kid
+        self.current[client] = new_id
+        self.kid = new_id
+
+        # Update kd5.lock files
+        self.update_lockfile(new_id)
+        logger.info('Kernel change from {} to {}'.format(old_id, new_id))
+
+    def update_lockfile(self, new_id):
+        """ Update lock files """
+
+        LogDir = os.path.expanduser("~") + "/.cpyvke/"
+
+        with open(LogDir + 'kd5.lock', 'w') as f:
+            f.write(new_id)
+
+    def send_variables(self, watch, msg):
+        """ Send the changes in the variable list of a kernel to clients """
+
+        if 'full' in msg:
+            self.cache.invalidate(watch.kid)
+        else:
+            self.cache.invalidate(watch.kid, set(msg['changed']) | set(msg['removed']))
+
+        self.publish(msg)
+        logger.info('Variable list v{} of {} sent to {} client(s)'.format(watch.version, watch.kid,
+                                                                        len(self.subscribers)))
+
+    def send_snapshot(self, kid=None):
+        """ Send the whole variable list of a kernel (all by default) to
+        clients """
+
+        for watch in self.kernels.values():
+            if kid in (None, watch.kid):
+                self.publish(full_msg(watch.kid, watch.version, watch.snapshot))
+                logger.info('Full variable list v{} of {} sent to {} client(s)'.format(watch.version, watch.kid,
+                                                                                     len(self.subscribers)))
+
+    async def fetch_request(self, client, frame):
+        """ Handle a request frame :
+            handle kernel changes | exec code | stop signal.
+
+        A request with a non-zero id gets a REPLY frame with the same id once
+        done : {'status': 'ok'|'error', 'value': ..., 'error': ...}
+        Code may also be given a deadline ('timeout' in the body) and be
+        cancelled with a CANCEL frame carrying its id.
+        """
+
+        logger.info('Request from client')
+        logger.debug('RECEIVED :\n {}'.format(frame))
+
+        rid = frame.id or None
+        body = frame.body if isinstance(frame.body, dict) else {}
+        REQUESTS.inc(type=REQUEST_TYPES.get(frame.type, 'unknown'))
+
+        if frame.type == comm.CONNECT:
+            await self.kernel_change(body['cf'], client)
+
+        elif frame.type == comm.WATCH:
+            await self.watch_kernel(body['cf'])
+
+        elif frame.type == comm.SYNC:
+            self.send_snapshot(body.get('kernel'))
+
+        elif frame.type == comm.STOP:
+            self.stop()
+
+        elif frame.type == comm.HELLO:
+            self.codecs[client] = choose_codec(body.get('codecs', []))
+            logger.info('Request client reads {} frames'.format(self.codecs[client]))
+            self.reply(client, rid, {'codec': self.codecs[client], 'threshold': self.threshold})
+            return
+
+        elif frame.type == comm.CANCEL:
+            task = self.requests.get((client, frame.id))
+            if task:
+                task.cancel()
+            return
+
+        elif frame.type == comm.CODE:
+            watch = self.client_kernel(client)
+            key = self.cache.key(watch, body.get('var'), body['code'])
+            value = self.cache.get(key)
+            if value is not None:
+                CACHE_HITS.inc()
+                logger.debug('Reply to {} from cache'.format(body['code']))
+                self.reply(client, rid, value)
+                return
+
+            msg_id = watch.submit(body['code'])
+            task = asyncio.ensure_future(self.reply_code(client, rid, watch, msg_id,
+                                                         body.get('timeout'), key))
+            if rid is not None:
+                self.requests[(client, rid)] = task
+            return
+
+        else:
+            logger.error('Unknown request type {:#x}'.format(frame.type))
+            self.reply(client, rid, error='Unknown request type {:#x}'.format(frame.type))
+            return
+
+        self.reply(client, rid)
+
+    async def reply_code(self, client, rid, watch, msg_id, timeout=None, key=None):
+        """ Wait for code to be executed, then reply to the client. The reply
+        is kept if **key** is given. """
+
+        start = time.time()
+        try:
+            output = await watch.wait(msg_id, timeout)
+        except asyncio.CancelledError:
+            output = {'value': None, 'error': 'Cancelled'}
+        finally:
+            self.requests.pop((client, rid), None)
+
+        TRACER.complete('execute', start, rid=rid, kernel=watch.kid, error=output['error'])
+
+        # Force Update var list if the kernel does not push changes
+        if watch.comm_id is None:
+            watch.schedule_refresh()
+
+        if not output['error']:
+            self.cache.put(key, output['value'])
+
+        self.reply(client, rid, output['value'], output['error'])
+
+    def reply(self, client, rid, value=None, error=None):
+        """ Reply to request **rid** of a client (if the request has an id) """
+
+        if rid is None or client.is_closing():
+            return
+
+        reply = {'status': 'error' if error else 'ok', 'value': value, 'error': error}
+        with TRACER.span('reply', rid=rid) as args:
+            frame = pack_frame(comm.REPLY, reply, rid, self.codecs.get(client), self.threshold)
+            SENT_BYTES.inc(len(frame), socket='request')
+            client.write(frame)
+            args['bytes'] = len(frame)
+
+    async def handle_metrics(self, reader, writer):
+        """ Metrics client (Prometheus for instance) : any HTTP request is
+        answered with all the metrics in the Prometheus text format """
+
+        try:
+            # Request line and headers
+            while (await reader.readline()).strip():
+                pass
+            body = (METRICS.render() + self.gauges.render()).encode('utf8')
+            writer.write(b'HTTP/1.0 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         b'Content-Length: %d\r\n\r\n' % len(body) + body)
+            await writer.drain()
+        except OSError:
+            pass
+
+        writer.close()
 
     def stop(self):
-        """ Stop thread. """
+        """ Stop the daemon. """
 
         logger.info("Client sent SIGTERM")
-        self._stop.set()
+        self._quit.set()
 
 
 class Daemonize(Daemon):
@@ -393,18 +958,32 @@ class Daemonize(Daemon):
         self.cf = WatcherArgs['cf']
         self.sport = WatcherArgs['sport']
         self.rport = WatcherArgs['rport']
-        self.delay = WatcherArgs['delay']
+        self.transport = WatcherArgs['transport']
+        self.interval = WatcherArgs['interval']
+        self.timeout = WatcherArgs['timeout']
+        self.interrupt = WatcherArgs['interrupt']
+        self.cache_size = WatcherArgs['cache_size']
+        self.threshold = WatcherArgs['threshold']
+        self.metrics_port = WatcherArgs['metrics_port']
+        self.trace = WatcherArgs['trace']
 
     def run(self):
         """ Override Daemon run method with this method. """
 
-        km, kc = connect_kernel(self.cf)
-        WK = Watcher(kc,
+        if self.trace:
+            TRACER.start(self.trace, 'kd5')
+
+        WK = Watcher(self.cf,
                      sport=self.sport,
                      rport=self.rport,
-                     delay=self.delay)
-        WK.start()
-        WK.join()
+                     interval=self.interval,
+                     timeout=self.timeout,
+                     interrupt=self.interrupt,
+                     transport=self.transport,
+                     cache_size=self.cache_size,
+                     threshold=self.threshold,
+                     metrics_port=self.metrics_port)
+        WK.run()
 
 
 def parse_args(lockfile, pidfile, Config):
@@ -417,6 +996,9 @@ def parse_args(lockfile, pidfile, Config):
                         help="Start up with existing kernel. \
                         INTEGER is the id of the connection file.",
                         nargs='?')
+    parser.add_argument("--trace", help="Write the spans of the requests to \
+                        ~/.cpyvke/trace.json (Chrome trace format)",
+                        action="store_true")
     args = parser.parse_args()
 
     # start|last actions
@@ -599,7 +1181,17 @@ def main(args=None):
 
     sport = int(Config['comm']['s-port'])
     rport = int(Config['comm']['r-port'])
-    delay = float(Config['daemon']['refresh'])
+    transport = Config['comm']['transport']
+    threshold = int(Config['comm']['compress-threshold'])
+    interval = float(Config['daemon']['min-interval'])
+    timeout = float(Config['daemon']['timeout'])
+    interrupt = Config['daemon']['interrupt'] == 'True'
+    cache_size = int(float(Config['daemon']['cache-size'])*1024**2)
+    metrics_port = int(Config['daemon']['metrics-port'])
+    if args.trace or Config['inspect']['trace'] == 'True':
+        trace = logdir + 'trace.json'
+    else:
+        trace = None
 
     try:
         cfile = find_connection_file(kid)
@@ -610,9 +1202,16 @@ def main(args=None):
         kdwrite(lockfile, kid)
 
     WatchConf = {'cf': cfile,
-                 'delay': delay,
+                 'interval': interval,
+                 'timeout': timeout,
+                 'interrupt': interrupt,
+                 'cache_size': cache_size,
                  'sport': sport,
-                 'rport': rport}
+                 'rport': rport,
+                 'transport': transport,
+                 'threshold': threshold,
+                 'metrics_port': metrics_port,
+                 'trace': trace}
 
     daemon = Daemonize(pidfile, WatchConf, stdout=logfile, stderr=logfile)
 
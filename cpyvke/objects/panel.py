@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Mon Nov 14 09:08:25 2016
-# Last Modified : mar. 03 avril 2018 15:55:45 CEST
+# Last Modified : dim. 18 oct. 2026 19:48:03 CEST
 """
 -----------
 DOCSTRING
@@ -39,7 +39,6 @@ from cpyvke.curseswin.prompt import Prompt
 from cpyvke.curseswin.app import check_size
 from cpyvke.utils.kd import restart_daemon
 from cpyvke.utils.display import format_cell
-from cpyvke.utils.comm import send_msg
 
 code = locale.getpreferredencoding()
 
@@ -321,7 +320,7 @@ class BasePanel(abc.ABC):
             self.prompt_msg_setup(err)
         elif code:
             try:
-                send_msg(self.sock.RequestSock, '<code>' + code)
+                self.sock.run_code(code)
                 self.logger.info('Code sent to kernel : {}'.format(code))
                 self.prompt_msg_setup('Code sent !')
             except Exception:
@@ -522,6 +521,8 @@ class ListPanel(BasePanel):
             if self.mk_sort == 'name':
                 self.mk_sort = 'type'
             elif self.mk_sort == 'type':
+                self.mk_sort = 'size'
+            elif self.mk_sort == 'size':
                 self.mk_sort = 'name'
             self.arange_lst()
 
@@ -664,6 +665,13 @@ class ListPanel(BasePanel):
 
         return [item[0] for item in types]
 
+    @staticmethod
+    def size_sort(item_dic):
+        """ Sort variable by size (biggest first). """
+
+        return sorted(item_dic, key=lambda key: item_dic[key].get('nbytes') or 0,
+                      reverse=True)
+
     def arange_lst(self):
         """ Organize/Arange variable list. """
 
@@ -673,6 +681,9 @@ class ListPanel(BasePanel):
         elif self.mk_sort == 'type':
             self.item_keys = self.type_sort(self.item_dic)
 
+        elif self.mk_sort == 'size':
+            self.item_keys = self.size_sort(self.item_dic)
+
         elif self.mk_sort == 'filter' and self.filter:
             self.item_keys = self.filter_var_lst(self.item_dic, self.filter)
             if not self.item_keys:
@@ -20,40 +20,237 @@
 #
 #
 # Creation Date : jeu. 01 mars 2018 15:09:06 CET
-# Last Modified : mar. 27 mars 2018 23:22:52 CEST
+# Last Modified : lun. 19 oct. 2026 00:27:05 CEST
 """
 -----------
 DOCSTRING
 
+Framing of the messages exchanged between kd5 and its clients.
+
+Each frame starts with a 12-byte header (network byte order) :
+
+    magic (1B) | version (1B) | type (1B) | flags (1B) | id (4B) | length (4B)
+
+followed by **length** bytes of body. If the JSON flag is set, the body is a
+JSON document, otherwise raw bytes. **id** is the request id (0 if the
+request does not expect a reply), echoed in the reply.
+
+Bodies may be compressed (ZLIB or LZ4 flag). A peer only compresses what it
+sends to a client that announced the codecs it can read with a HELLO frame,
+so that clients ignoring compression keep working.
+
 @author: Cyril Desjouy
 """
 
 
+import os
+import json
+import zlib
 import struct
+import asyncio
+from collections import namedtuple, OrderedDict
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+MAGIC = 0xC5
+VERSION = 1
+HEADER = struct.Struct('>BBBBII')
+
+# Frame types
+PING = 0x01         # Heartbeat (stream socket), answered with PONG
+NAMESPACE = 0x02    # Namespace snapshot or delta (stream socket)
+HELLO = 0x03        # Codecs the client can read : {'codecs': [name]}
+PONG = 0x04         # Heartbeat reply (stream socket)
+CODE = 0x10         # Execute code : {'code': str, 'timeout': s, 'var': inspected}
+CONNECT = 0x11      # Connect client to kernel : {'cf': connection file}
+WATCH = 0x12        # Watch kernel : {'cf': connection file}
+SYNC = 0x13         # Ask for full snapshots : {'kernel': kid|None}
+CANCEL = 0x14       # Cancel request id
+STOP = 0x15         # Stop the daemon
+REPLY = 0x20        # Reply : {'status': 'ok'|'error', 'value', 'error'}
+
+# Flags
+JSON = 0x01
+ZLIB = 0x02
+LZ4 = 0x04
+
+# Codecs this side can use, preferred first : name -> (flag, compress)
+CODECS = OrderedDict()
+if lz4 is not None:
+    CODECS['lz4'] = LZ4, lz4.frame.compress
+CODECS['zlib'] = ZLIB, lambda data: zlib.compress(data, 1)
+
+Frame = namedtuple('Frame', ['type', 'id', 'flags', 'body'])
+
+
+class ProtocolError(ValueError):
+    """ Frame not understood (not a cpyvke frame or unknown version) """
+
+
+def socket_path(name):
+    """ Path of the Unix domain socket **name** (stream|request) """
+    return os.path.expanduser('~') + '/.cpyvke/kd5-{}.sock'.format(name)
+
+
+def pack_frame(typ, body=None, rid=0, codec=None, threshold=0):
+    """ Serialize a frame. **body** is sent as is if bytes, as JSON else.
+    Bodies of at least **threshold** bytes are compressed with **codec**. """
+    flags = 0
+    if body is None:
+        body = b''
+    elif not isinstance(body, (bytes, bytearray, memoryview)):
+        body = json.dumps(body).encode('utf8')
+        flags |= JSON
+    if codec in CODECS and len(body) >= threshold:
+        flag, compress = CODECS[codec]
+        packed = compress(body)
+        if len(packed) < len(body):
+            body, flags = packed, flags | flag
+    return HEADER.pack(MAGIC, VERSION, typ, flags, rid, len(body)) + body
+
+
+def choose_codec(codecs):
+    """ Preferred codec among those a peer can read (None if none) """
+    return next((name for name in CODECS if name in codecs), None)
+
+
+def decompress(flags, payload):
+    """ Uncompressed body of a frame """
+    if flags & ZLIB:
+        return zlib.decompress(payload)
+    if flags & LZ4:
+        if lz4 is None:
+            raise ProtocolError('lz4 frame received but lz4 is not installed')
+        return lz4.frame.decompress(payload)
+    return payload
+
+
+def unpack_header(raw):
+    """ Return type, flags, id and body length from a header """
+    magic, version, typ, flags, rid, length = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ProtocolError('Not a cpyvke frame')
+    if version != VERSION:
+        raise ProtocolError('Unsupported protocol version {}'.format(version))
+    return typ, flags, rid, length
+
+
+def make_frame(typ, flags, rid, payload):
+    """ Decode the body of a frame (payload may be any bytes-like object) """
+    payload = decompress(flags, payload)
+    body = json.loads(str(payload, 'utf8')) if flags & JSON else bytes(payload)
+    return Frame(typ, rid, flags, body)
 
 
-def send_msg(sock, msg):
-    """ Prefix each message with a 4-byte length (network byte order) """
-    msg = struct.pack('>I', len(msg)) + msg.encode('utf8')
-    sock.sendall(msg)
+def send_frame(sock, typ, body=None, rid=0):
+    """ Send a frame """
+    sock.sendall(pack_frame(typ, body, rid))
 
 
-def recv_msg(sock):
-    """ Read message length and unpack it into an integer """
-    raw_msglen = recv_all(sock, 4)
-    if not raw_msglen:
+def recv_frame(sock):
+    """ Read a frame. None if EOF is hit """
+    raw = recv_all(sock, HEADER.size)
+    if not raw:
         return None
-    msglen = struct.unpack('>I', raw_msglen)[0]
-    # Read the message data
-    return recv_all(sock, msglen)
+    typ, flags, rid, length = unpack_header(raw)
+    payload = recv_all(sock, length) if length else b''
+    if payload is None:
+        return None
+    return make_frame(typ, flags, rid, payload)
 
 
 def recv_all(sock, n):
     """ Helper function to recv n bytes or return None if EOF is hit """
-    data = b''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
-            return None
-        data += packet
+    data = bytearray(n)
+    with memoryview(data) as view:
+        got = 0
+        while got < n:
+            packet = sock.recv_into(view[got:])
+            if not packet:
+                return None
+            got += packet
     return data
+
+
+class FrameReader:
+    """ Read frames from a socket, blocking or not.
+
+    Bytes are received with recv_into in a buffer reused from a frame to the
+    next (grown if a frame does not fit), and decoded in place. A frame that
+    is only partially arrived on a non-blocking socket is kept until the
+    rest comes in.
+    """
+
+    def __init__(self, sock, size=64*1024):
+
+        self.sock = sock
+        self.buf = bytearray(size)
+        self.start = 0      # First byte not decoded
+        self.end = 0        # End of received bytes
+
+    def recv(self):
+        """ Next frame. None if EOF is hit. Raise BlockingIOError if the
+        socket has no complete frame yet """
+
+        while True:
+            frame = self.parse()
+            if frame is not None:
+                return frame
+            if not self.fill():
+                return None
+
+    def parse(self):
+        """ Decode the next frame if it is complete in the buffer """
+
+        pending = self.end - self.start
+        if pending < HEADER.size:
+            self.reserve(HEADER.size)
+            return None
+
+        typ, flags, rid, length = unpack_header(self.buf[self.start:self.start + HEADER.size])
+        size = HEADER.size + length
+        if pending < size:
+            self.reserve(size)
+            return None
+
+        with memoryview(self.buf) as view:
+            with view[self.start + HEADER.size:self.start + size] as payload:
+                frame = make_frame(typ, flags, rid, payload)
+
+        self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        return frame
+
+    def reserve(self, size):
+        """ Make room for **size** bytes from the first one not decoded """
+
+        if self.start + size <= len(self.buf):
+            return
+
+        pending = self.end - self.start
+        self.buf[:pending] = self.buf[self.start:self.end]
+        self.start, self.end = 0, pending
+        if size > len(self.buf):
+            self.buf.extend(bytes(max(size, 2*len(self.buf)) - len(self.buf)))
+
+    def fill(self):
+        """ Receive what the socket has. False if EOF is hit """
+
+        with memoryview(self.buf) as view:
+            n = self.sock.recv_into(view[self.end:])
+        self.end += n
+        return n > 0
+
+
+async def async_recv_frame(reader):
+    """ Same as recv_frame, from an asyncio StreamReader """
+    try:
+        typ, flags, rid, length = unpack_header(await reader.readexactly(HEADER.size))
+        return make_frame(typ, flags, rid, await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
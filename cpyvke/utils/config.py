@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : mar. 29 nov. 2016 23:18:27 CET
-# Last Modified : lun. 09 avril 2018 22:46:28 CEST
+# Last Modified : lun. 19 oct. 2026 10:52:31 CEST
 """
 -----------
 DOCSTRING
@@ -112,9 +112,21 @@ class cfg_setup:
         self.cfg.add_section('comm')
         self.cfg.set('comm', 's-port', 15557)
         self.cfg.set('comm', 'r-port', 15556)
+        self.cfg.set('comm', 'transport', 'tcp')
+        self.cfg.set('comm', 'compression', 'True')
+        self.cfg.set('comm', 'compress-threshold', 4096)
+        self.cfg.set('comm', 'heartbeat', 1)
 
         self.cfg.add_section('daemon')
-        self.cfg.set('daemon', 'refresh', 0.1)
+        self.cfg.set('daemon', 'min-interval', 0.5)
+        self.cfg.set('daemon', 'timeout', 10)
+        self.cfg.set('daemon', 'interrupt', 'True')
+        self.cfg.set('daemon', 'cache-size', 64)
+        self.cfg.set('daemon', 'metrics-port', 0)
+
+        self.cfg.add_section('inspect')
+        self.cfg.set('inspect', 'mmap-size', 256)
+        self.cfg.set('inspect', 'trace', 'False')
 
         self.cfg.add_section('kernel version')
         self.cfg.set('kernel version', 'version', '3')
@@ -157,11 +169,41 @@ class cfg_setup:
             else:
                 kver = 3
 
-            # Refresh delay
-            if self.cfg.has_option('daemon', 'refresh'):
-                delay = self.cfg.get('daemon', 'refresh')
+            if self.cfg.has_option('daemon', 'min-interval'):
+                interval = self.cfg.get('daemon', 'min-interval')
+            else:
+                interval = 0.5
+
+            if self.cfg.has_option('daemon', 'timeout'):
+                timeout = self.cfg.get('daemon', 'timeout')
+            else:
+                timeout = 10
+
+            if self.cfg.has_option('daemon', 'interrupt'):
+                interrupt = self.cfg.get('daemon', 'interrupt')
+            else:
+                interrupt = 'True'
+
+            if self.cfg.has_option('daemon', 'cache-size'):
+                cache_size = self.cfg.get('daemon', 'cache-size')
+            else:
+                cache_size = 64
+
+            if self.cfg.has_option('daemon', 'metrics-port'):
+                metrics_port = self.cfg.get('daemon', 'metrics-port')
+            else:
+                metrics_port = 0
+
+            # INSPECTION
+            if self.cfg.has_option('inspect', 'mmap-size'):
+                mmap_size = self.cfg.get('inspect', 'mmap-size')
             else:
-                delay = 0.1
+                mmap_size = 256
+
+            if self.cfg.has_option('inspect', 'trace'):
+                trace = self.cfg.get('inspect', 'trace')
+            else:
+                trace = 'False'
 
             # COMM
             if self.cfg.has_option('comm', 'r-port'):
@@ -174,6 +216,26 @@ class cfg_setup:
             else:
                 sport = 15555
 
+            if self.cfg.has_option('comm', 'transport'):
+                transport = self.cfg.get('comm', 'transport')
+            else:
+                transport = 'tcp'
+
+            if self.cfg.has_option('comm', 'compression'):
+                compression = self.cfg.get('comm', 'compression')
+            else:
+                compression = 'True'
+
+            if self.cfg.has_option('comm', 'compress-threshold'):
+                threshold = self.cfg.get('comm', 'compress-threshold')
+            else:
+                threshold = 4096
+
+            if self.cfg.has_option('comm', 'heartbeat'):
+                heartbeat = self.cfg.get('comm', 'heartbeat')
+            else:
+                heartbeat = 1
+
             # WARNING COLORS
             if self.cfg.has_option('warning colors', 'text'):
                 wg_txt = self.cfg.get('warning colors', 'text')
@@ -317,8 +379,18 @@ class cfg_setup:
                                     'ascii-font': ascii},
                            'kernel version': {'version': kver},
                            'comm': {'s-port': sport,
-                                    'r-port': rport},
-                           'daemon': {'refresh': delay}}
+                                    'r-port': rport,
+                                    'transport': transport,
+                                    'compression': compression,
+                                    'compress-threshold': threshold,
+                                    'heartbeat': heartbeat},
+                           'daemon': {'min-interval': interval,
+                                      'timeout': timeout,
+                                      'interrupt': interrupt,
+                                      'cache-size': cache_size,
+                                      'metrics-port': metrics_port},
+                           'inspect': {'mmap-size': mmap_size,
+                                       'trace': trace}}
 
             # Init save Directory
             self.check_dir(self.save_dir)
@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : mar. 13 mars 2018 12:01:45 CET
-# Last Modified : ven. 30 mars 2018 23:48:03 CEST
+# Last Modified : lun. 19 oct. 2026 11:25:02 CEST
 """
 -----------
 DOCSTRING
@@ -52,20 +52,6 @@ def str_format(string, width):
     return output
 
 
-def whos_to_dic(string):
-    """ Format output of daemon to a dictionnary """
-
-    variables = {}
-    for item in string.split('\n')[2:]:
-        tmp = [j for j in item.split(' ') if j != '']
-        if tmp:
-            var_name = tmp[0]
-            var_typ = tmp[1]
-            var_val = ' '.join(tmp[2:])
-            variables[var_name] = {'value': var_val, 'type': var_typ}
-    return variables
-
-
 def dump(obj, nested_level=0, output=[]):
     """ Format dict, list and tuples variables for displaying. """
 
@@ -116,58 +102,96 @@ def dump(obj, nested_level=0, output=[]):
     return output
 
 
+def format_summary(summary):
+    """ Format the summary statistics computed by inspector.describe """
+
+    output = ['Shape : {}'.format(tuple(summary['shape'])), '']
+    for name, stats in summary['columns'].items():
+        if name:
+            output.append('[{}]'.format(name))
+        output.append('dtype : {:<12} count : {:<12} NaN : {:<12} inf : {}'.format(
+            stats['dtype'], stats['count'], stats['nan'], stats.get('inf', 0)))
+        if stats['mean'] is not None:
+            output.append('min : {min:<12.6g} max : {max:<12.6g} mean : {mean:<12.6g} std : {std:.6g}'.format(**stats))
+            output.append('  '.join(['{} : {:.6g}'.format(q, v) for q, v in stats['quantiles'].items()]))
+            top = max(stats['hist']) or 1
+            output.append('hist : ' + ''.join(['▁▂▃▄▅▆▇█'[int(7*c/top)] for c in stats['hist']]) +
+                          '  ({} bins)'.format(len(stats['hist'])))
+        output.append('')
+
+    return output
+
+
 def format_cell(variables, name, screen_width):
     """ Format data for display """
 
     screen_width = screen_width - 4
 
-    if '/kernel' in variables[name]['value']:
-        return format_kernel(variables, name, screen_width)
-    else:
+    # Variables streamed by kd5 (see inspector.summarize)
+    if 'nbytes' in variables[name]:
         return format_variable(variables, name, screen_width)
+    # Attributes listed by inspector.inspect_class*
+    elif variables[name]['type'].startswith(('<class ', '@<class ')):
+        return format_attribute(variables, name, screen_width)
+    else:
+        return format_kernel(variables, name, screen_width)
 
 
 def format_variable(variables, name, screen_width):
     """ Format regular variables """
 
     max_width = int(screen_width/5)
+    entry = variables[name]
+    typ = '[' + entry['type'] + ']'
 
-    # Types
-    if "@<class '" in variables[name]['type']:
-        typ = '[inst. ' + variables[name]['type'].split("'")[1] + ']'
-    elif "<class '" in variables[name]['type']:
-        typ = '[' + variables[name]['type'].split("'")[1] + ']'
+    # Only display dimensions of arrays/frames
+    if entry.get('shape'):
+        val = 'x'.join(str(i) for i in entry['shape'])
+        if entry.get('dtype'):
+            val = val + ' [' + entry['dtype'] + ']'
+
+    # Number of items of truncated containers
+    elif entry.get('len') is not None and entry['type'] not in ('str', 'bytes') and \
+            entry['value'].endswith(('...}', '...]', '...)')):
+        val = '{} ({} items)'.format(entry['value'], entry['len'])
+
+    # Preview (repr : \n not interpreted in strings)
     else:
-        typ = '[' + variables[name]['type'] + ']'
+        val = entry['value']
 
-    # Only display module name
-    if 'module' in variables[name]['value']:
-        val = variables[name]['value'].split("'")[1]
+    return format_columns(name, val, typ, max_width, screen_width)
+
+
+def format_attribute(variables, name, screen_width):
+    """ Format attributes of classes and instances """
+
+    max_width = int(screen_width/5)
+    typ = variables[name]['type']
+    val = variables[name]['value']
 
-    # Only display dimensions of array
-    elif 'elem' in variables[name]['value']:
-        val1 = variables[name]['value'].split(":")[0]
-        val2 = variables[name]['value'].split("`")[1]
-        val = val1 + ' [' + val2 + ']'
+    # Name of the type
+    tname = typ.split("'")[1]
+    if typ.startswith('@'):
+        typ = '[inst. ' + tname + ']'
+    else:
+        typ = '[' + tname + ']'
 
-    elif 'classmethod' in variables[name]['value']:
-        val = 'classmethod'
+    if tname in ('classmethod', 'staticmethod'):
+        val = tname
 
-    elif 'staticmethod' in variables[name]['value']:
-        val = 'staticmethod'
+    # Only display module name
+    elif tname == 'module' and val.count("'") >= 2:
+        val = val.split("'")[1]
 
-    elif ' at' in variables[name]['value']:
-        val = variables[name]['value'].split(' at ')[0] + '>'
+    # Drop addresses
+    elif tname in ('function', 'method', 'builtin_function_or_method') and ' at ' in val:
+        val = val.split(' at ')[0] + '>'
 
-    elif 'frozenset' in variables[name]['value']:
-        val = variables[name]['value'].split('(')[1].split(')')[0]
+    return format_columns(name, val, typ, max_width, screen_width)
 
-    elif '<...>' in variables[name]['value']:
-        val = variables[name]['value'].split('<')[0] + '...'
 
-    else:
-        # Repr to avoid interpreting \n in strings
-        val = variables[name]['value']
+def format_columns(name, val, typ, max_width, screen_width):
+    """ Name, value and type cells, cut to fit the screen """
 
     # Check length of each entry
     if len(val) > 3*max_width:
@@ -204,6 +228,10 @@ def format_kernel(variables, name, screen_width):
     if len(typ) > max_width:
         typ = typ[0:max_width-4] + '... '
 
+    # Number of objects for kernels watched by the daemon
+    if variables[name].get('count') is not None:
+        typ += ' {} obj.'.format(variables[name]['count'])
+
     s1 = "{:{wname}} {:{wval}}".format(name, val, wname=max_width, wval=3*max_width)
     s2 = "{:{wtype}}".format(typ, wtype=screen_width-len(s1))
 
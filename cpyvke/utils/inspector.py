@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Wed Nov  9 16:27:41 2016
-# Last Modified : lun. 09 avril 2018 21:56:41 CEST
+# Last Modified : lun. 19 oct. 2026 12:04:15 CEST
 """
 -----------
 DOCSTRING
@@ -36,14 +36,26 @@ pd.set_option('display.max_rows', None)     # 显示所有行
 pd.set_option('display.max_columns', None)  # 显示所有列
 
 import os
-from time import time, sleep
+import json
+import mmap
+import hashlib
+import reprlib
+from time import time
+from collections import OrderedDict
 from multiprocessing import Process
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
 import sys
+import tempfile
 import locale
 from inspect import getsource
 from cpyvke.curseswin.widgets import suspend_curses
-from cpyvke.utils.comm import send_msg
+from cpyvke.utils.namespace import namespace_delta, is_empty
+from cpyvke.utils.trace import TRACER
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
 
 locale.setlocale(locale.LC_ALL, '')
@@ -54,6 +66,18 @@ def get_source_code(code):
     return getsource(code)
 
 
+def read_only(func):
+    """ Helper run by kd5 that leaves the namespace untouched : the
+    post_run_cell hook does not look for changes after it. """
+
+    def run(*k, **kw):
+        _notifier.skip = True
+        return func(*k, **kw)
+
+    return run
+
+
+@read_only
 def inspect_class_instance(class_inst):
     """ Return a dictionnary of :
         * class attributes    : inst.__class__.__dict__
@@ -70,6 +94,7 @@ def inspect_class_instance(class_inst):
     return dict(class_attr, **inst_attr)
 
 
+@read_only
 def inspect_class(class_inst):
     """ Return a dictionnary of :
         * class attributes    : inst.__class__.__dict__
@@ -81,6 +106,612 @@ def inspect_class(class_inst):
     return class_attr
 
 
+_repr = reprlib.Repr()
+_repr.maxstring = 80
+_repr.maxother = 80
+
+# Values hashed to fingerprint arrays/frames. Arrays and frames up to FP_FULL
+# bytes are hashed entirely.
+FP_SAMPLE = 4096
+FP_FULL = 1 << 20
+
+# Arrow pages still there after ARROW_TTL seconds were never read (timed out
+# or cancelled requests) : the kernel that wrote them removes them.
+ARROW_TTL = 60
+
+_pool = None
+
+
+def fingerprint(obj):
+    """ Cheap fingerprint of the content of an array, DataFrame, Series or
+    Index : identity, shape, dtype, address of the data and hash of up to
+    FP_SAMPLE evenly spaced values (all of them for small arrays and frames).
+    A change of a value that is not sampled goes unnoticed : fingerprints of
+    sampled objects end with '~'. None for other objects or if it cannot be
+    computed.
+    """
+
+    try:
+        return _fingerprint(obj)
+    except Exception:
+        return None
+
+
+def _fingerprint(obj):
+
+    h = hashlib.blake2b(digest_size=8)
+    sampled = False
+
+    if isinstance(obj, np.ndarray):
+        h.update(repr((id(obj), obj.shape, obj.dtype.str, obj.strides,
+                       obj.__array_interface__['data'][0])).encode())
+        if obj.size > FP_SAMPLE and (obj.dtype.hasobject or obj.nbytes > FP_FULL):
+            sample = obj.flat[np.linspace(0, obj.size - 1, FP_SAMPLE).astype(np.intp)]
+            sampled = True
+        else:
+            sample = obj
+        if obj.dtype.hasobject:
+            sample = np.array([id(item) for item in sample.flat])
+        h.update(np.ascontiguousarray(sample).data)
+
+    elif isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        dtypes = obj.dtypes.tolist() if isinstance(obj, pd.DataFrame) else obj.dtype
+        h.update(repr((id(obj), obj.shape, dtypes)).encode())
+        nbytes = obj.memory_usage(deep=False).sum() if isinstance(obj, pd.DataFrame) else obj.nbytes
+        if len(obj) > FP_SAMPLE and nbytes > FP_FULL:
+            rows = np.linspace(0, len(obj) - 1, FP_SAMPLE).astype(np.intp)
+            obj = obj[rows] if isinstance(obj, pd.Index) else obj.iloc[rows]
+            sampled = True
+        try:
+            h.update(pd.util.hash_pandas_object(obj).values.data)
+        except TypeError:       # Unhashable values (lists...) : layout only
+            pass
+
+    else:
+        return None
+
+    return h.hexdigest() + ('~' if sampled else '')
+
+
+def fingerprints(objs):
+    """ Fingerprints of several objects. Hashing releases the GIL : large
+    objects are processed in a thread pool. """
+
+    global _pool
+
+    large = [name for name, obj in objs.items() if _nbytes(obj) > FP_FULL]
+    if len(large) < 2:
+        return {}
+
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+
+    return dict(zip(large, _pool.map(fingerprint, [objs[name] for name in large])))
+
+
+def _nbytes(obj):
+    """ nbytes attribute of **obj** (0 if missing or broken) """
+
+    try:
+        return getattr(obj, 'nbytes', 0)
+    except Exception:       # __getattr__ raising KeyError for instance
+        return 0
+
+
+def summarize(obj, fp=None):
+    """ Return a short, machine-readable description of **obj** :
+        * type    : name of the type
+        * value   : short preview
+        * shape   : shape of arrays/frames (None otherwise)
+        * dtype   : dtype of arrays (None otherwise)
+        * len     : length of sized objects (None otherwise)
+        * nbytes  : size in memory
+        * id      : identity of the object
+        * fp      : fingerprint of arrays/frames (**fp** if already known)
+    """
+
+    shape = getattr(obj, 'shape', None)
+    if not isinstance(shape, tuple):
+        shape = None
+
+    dtype = getattr(obj, 'dtype', None)
+    dtype = str(dtype) if shape is not None and dtype is not None else None
+
+    try:
+        length = len(obj)
+    except Exception:
+        length = None
+
+    try:
+        if isinstance(obj, pd.DataFrame):
+            nbytes = int(obj.memory_usage(deep=False).sum())
+        elif isinstance(obj, (np.ndarray, pd.Series, pd.Index)):
+            nbytes = int(obj.nbytes)
+        else:
+            nbytes = sys.getsizeof(obj)
+    except Exception:
+        nbytes = None
+
+    if shape:
+        value = 'x'.join(str(i) for i in shape)
+    elif type(obj).__name__ == 'module':
+        value = obj.__name__
+    else:
+        try:
+            value = _repr.repr(obj).replace('\n', '\\n')
+        except Exception:
+            value = '<...>'
+
+    return {'type': type(obj).__name__, 'value': value, 'shape': shape,
+            'dtype': dtype, 'len': length, 'nbytes': nbytes, 'id': id(obj),
+            'fp': fp if fp is not None else fingerprint(obj)}
+
+
+def summarize_namespace():
+    """ Summary of each variable of the interactive namespace. Names
+    hidden by IPython, private names and temporary variables used by cpyvke
+    are skipped like the 'whos' magic does. """
+
+    from IPython import get_ipython
+
+    ip = get_ipython()
+    nonmatching = object()
+    objs = {name: obj for name, obj in list(ip.user_ns.items())
+            if not (name.startswith('_') or name.startswith('fcpyvke') or
+                    obj is ip.user_ns_hidden.get(name, nonmatching))}
+    fps = fingerprints(objs)
+
+    summary = {}
+    for name, obj in objs.items():
+        try:
+            summary[name] = summarize(obj, fps.get(name))
+        except Exception:   # Broken __getattr__, shape, __len__...
+            summary[name] = {'type': type(obj).__name__, 'value': '<...>', 'shape': None,
+                             'dtype': None, 'len': None, 'nbytes': None, 'id': id(obj),
+                             'fp': None}
+
+    return summary
+
+
+@read_only
+def whos_json():
+    """ Print the namespace summary as JSON. Replaces the 'whos' magic. """
+
+    print(json.dumps(summarize_namespace(), default=str))
+
+
+# Shared memory segments exposed to cpyvke (kernel side), by variable name
+_shared = {}
+
+
+@read_only
+def share_ndarray(name, arr, mmap_size=None):
+    """ Copy an array in a shared memory segment and print where to find it
+    as JSON. Fall back to a .npy file if shared memory is not available
+    (no /dev/shm to map it from, or object array).
+
+    Arrays larger than **mmap_size** bytes are not copied in memory : the
+    backing file of a np.memmap is given as is, other arrays are written
+    once to a .npy file that cpyvke memory-maps.
+    """
+
+    release_ndarray(name)
+
+    big = mmap_size is not None and arr.nbytes > mmap_size
+    if (big and isinstance(arr, np.memmap) and isinstance(arr.base, mmap.mmap)
+            and arr.filename and (arr.flags.c_contiguous or arr.flags.f_contiguous)):
+        print(json.dumps({'memmap': arr.filename, 'offset': arr.offset, 'shape': arr.shape,
+                          'dtype': np.lib.format.dtype_to_descr(arr.dtype),
+                          'order': 'C' if arr.flags.c_contiguous else 'F'}))
+        return
+
+    if big or arr.dtype.hasobject or not os.path.isdir('/dev/shm'):
+        filename = '/tmp/tmp_' + name + '.npy'
+        np.save(filename, arr)
+        print(json.dumps({'file': filename, 'mmap': big and not arr.dtype.hasobject}))
+        return
+
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+    _shared[name] = shm
+    print(json.dumps({'shm': shm.name, 'shape': arr.shape,
+                      'dtype': np.lib.format.dtype_to_descr(arr.dtype)}))
+
+
+@read_only
+def release_ndarray(name):
+    """ Free the shared memory segment of **name** (kernel side). Arrays
+    already mapped by cpyvke remain valid. """
+
+    shm = _shared.pop(name, None)
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+
+
+def map_ndarray(meta):
+    """ Read-only array mapping a segment exported by share_ndarray. The data
+    are not copied. """
+
+    shape = tuple(meta['shape'])
+    dtype = np.lib.format.descr_to_dtype(meta['dtype'])
+    size = int(np.prod(shape)) * dtype.itemsize
+    if not size:
+        return np.empty(shape, dtype)
+
+    with open('/dev/shm/' + meta['shm'], 'rb') as f:
+        buf = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    return np.ndarray(shape, dtype, buffer=buf)
+
+
+def load_ndarray(meta):
+    """ Array exported by share_ndarray. Large arrays are memory-mapped
+    read-only : pages are only read when accessed. """
+
+    if 'shm' in meta:
+        return map_ndarray(meta)
+
+    if 'memmap' in meta:
+        return np.memmap(meta['memmap'], mode='r', offset=meta['offset'],
+                         shape=tuple(meta['shape']), order=meta['order'],
+                         dtype=np.lib.format.descr_to_dtype(meta['dtype']))
+
+    if meta.get('mmap'):
+        return np.load(meta['file'], mmap_mode='r')
+
+    return np.load(meta['file'], allow_pickle=True)
+
+
+def blocks(arr, size=1 << 20):
+    """ Flat float blocks of about **size** values of an array """
+
+    arr = np.atleast_1d(arr)
+    step = max(size*len(arr)//max(arr.size, 1), 1)
+    for i in range(0, len(arr), step):
+        yield np.asarray(arr[i:i + step], dtype=float).ravel()
+
+
+def array_stats(arr, bins=10, sample=100000):
+    """ Summary of a numeric array, computed by blocks so that no temporary
+    as large as the array is needed : min/max/mean/std (Chan et al. merge),
+    NaN and ±inf counts, quantiles of a strided sample, fixed-bin histogram.
+    Statistics are computed on finite values only. """
+
+    stats = {'dtype': str(arr.dtype), 'count': 0, 'nan': 0, 'inf': 0, 'min': None, 'max': None,
+             'mean': None, 'std': None, 'quantiles': {}, 'hist': []}
+    if not (np.issubdtype(arr.dtype, np.number) or arr.dtype == bool) or \
+            np.issubdtype(arr.dtype, np.complexfloating):
+        stats['count'] = int(np.size(arr))
+        return stats
+
+    n, mean, m2 = 0, 0., 0.
+    low, high, picked = np.inf, -np.inf, []
+    stride = max(np.size(arr)//sample, 1)
+    for block in blocks(arr):
+        finite = np.isfinite(block)
+        if finite.all():
+            valid = block
+        else:
+            valid = block[finite]
+            nans = int(np.isnan(block).sum())
+            stats['nan'] += nans
+            stats['inf'] += len(block) - len(valid) - nans
+        if not len(valid):
+            continue
+        nb, mb = len(valid), valid.mean()
+        m2 += ((valid - mb)**2).sum() + (mb - mean)**2*n*nb/(n + nb)
+        mean += (mb - mean)*nb/(n + nb)
+        n += nb
+        low, high = min(low, valid.min()), max(high, valid.max())
+        picked.append(valid[::stride])
+
+    stats['count'] = n
+    if not n:
+        return stats
+
+    stats.update({'min': float(low), 'max': float(high), 'mean': float(mean),
+                  'std': float(np.sqrt(m2/n))})
+    picked = np.concatenate(picked)
+    stats['quantiles'] = {'{:g}%'.format(100*q): float(v) for q, v in
+                          zip((0.05, 0.25, 0.5, 0.75, 0.95),
+                              np.quantile(picked, (0.05, 0.25, 0.5, 0.75, 0.95)))}
+
+    hist = np.zeros(bins, dtype=int)
+    for block in blocks(arr):
+        hist += np.histogram(block[np.isfinite(block)], bins, range=(low, high))[0]
+    stats['hist'] = hist.tolist()
+
+    return stats
+
+
+@read_only
+def describe(obj, bins=10):
+    """ Print summary statistics of an array (or per column of a DataFrame or
+    Series) as JSON """
+
+    shape = np.shape(obj)
+    if isinstance(obj, pd.Series):
+        obj = obj.to_frame()
+
+    if isinstance(obj, pd.DataFrame):
+        columns = {str(c): array_stats(obj[c].to_numpy(), bins) for c in obj.columns}
+    else:
+        columns = {'': array_stats(np.asarray(obj), bins)}
+
+    print(json.dumps({'shape': shape, 'columns': columns}))
+
+
+def as_frame(obj):
+    """ DataFrame holding a Series or an Index (one column per level) """
+
+    if isinstance(obj, pd.Series):
+        return obj.to_frame()
+    elif isinstance(obj, pd.Index):
+        return obj.to_frame(index=False)
+    return obj
+
+
+@read_only
+def frame_page(obj, start, stop, first=0, last=None, arrow=False):
+    """ Print rows [start, stop) and columns [first, last) of a DataFrame,
+    Series or Index as JSON, with the number of rows, the columns and their
+    dtypes.
+
+    If **arrow** is set and pyarrow is available, the rows are written as an
+    Arrow IPC stream whose file name is given instead of the values (unless
+    there are none : header only).
+    """
+
+    obj = as_frame(obj)
+    page = obj.iloc[start:stop, first:last]
+    header = {'rows': len(obj),
+              'columns': [str(c) for c in obj.columns],
+              'dtypes': [str(t) for t in obj.dtypes]}
+
+    if arrow and pa is not None and not page.empty:
+        try:
+            table = pa.Table.from_pandas(page, preserve_index=True)
+        except (pa.ArrowException, ValueError, TypeError):
+            pass            # Mixed object columns : send text
+        else:
+            folder = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            remove_stale_pages(folder)
+            fd, filename = tempfile.mkstemp(suffix='.arrow', dir=folder,
+                                            prefix='cpyvke-{}-'.format(os.getpid()))
+            with os.fdopen(fd, 'wb') as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            print(json.dumps(dict(header, arrow=filename)))
+            return
+
+    print(json.dumps(dict(header, index=[str(i) for i in page.index],
+                          data=page.astype(str).values.tolist())))
+
+
+def remove_stale_pages(folder):
+    """ Remove the Arrow pages written by this kernel that were never read """
+
+    prefix = 'cpyvke-{}-'.format(os.getpid())
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name.endswith('.arrow'):
+            filename = os.path.join(folder, name)
+            try:
+                if time() - os.path.getmtime(filename) > ARROW_TTL:
+                    os.remove(filename)
+            except OSError:
+                pass        # Read meanwhile
+
+
+@read_only
+def save_frame(obj, filename):
+    """ Write a whole DataFrame, Series or Index to **filename** (TSV) """
+
+    as_frame(obj).to_csv(filename, index=not isinstance(obj, pd.Index), sep='\t')
+
+
+def read_arrow(filename):
+    """ DataFrame written by frame_page as an Arrow IPC stream. The file is
+    removed once read. """
+
+    try:
+        with pa.memory_map(filename) as source:
+            return pa.ipc.open_stream(source).read_all().to_pandas()
+    finally:
+        os.remove(filename)
+
+
+class FramePager:
+    """ DataFrame/Series/Index living in the kernel. Rows are fetched by blocks,
+    for the columns displayed only, when they are needed.
+
+    Blocks are typed DataFrames when they come as Arrow record batches (if
+    pyarrow is importable by cpyvke and by the kernel), text otherwise.
+    """
+
+    # Rows fetched at once, blocks kept
+    block = 100
+    cached = 16
+    # Time (s) allowed to the kernel to write the whole frame
+    dump_timeout = 60
+
+    def __init__(self, sock, varname, timeout=3):
+
+        self.sock = sock
+        self.varname = varname
+        self.timeout = timeout
+        self.rows = 0
+        self.columns = []
+        self.dtypes = []
+        self.blocks = OrderedDict()
+        # Arrow pages are files read once : kd5 must not keep their replies
+        self.var = varname if pa is None else None
+
+    def __str__(self):
+        return '{} rows x {} columns'.format(self.rows, len(self.columns))
+
+    def code(self, start, stop, first=0, last=None):
+        """ Code fetching rows [start, stop) and columns [first, last) """
+
+        return "_inspect.frame_page({}, {}, {}, {}, {}, {})".format(self.varname, start, stop,
+                                                                   first, last, pa is not None)
+
+    def load(self, reply, key=None):
+        """ Read a page sent by the kernel. Keep it as block **key**. """
+
+        page = json.loads(reply['value'].splitlines()[-1])
+        self.rows, self.columns, self.dtypes = page['rows'], page['columns'], page['dtypes']
+
+        block = read_arrow(page['arrow']) if 'arrow' in page else (page['index'], page['data'])
+        if key is not None:
+            self.blocks[key] = block
+            while len(self.blocks) > self.cached:
+                self.blocks.popitem(last=False)
+
+        return page
+
+    def request(self, code, timeout, var=None):
+        """ Run code in the kernel and wait for the reply """
+
+        rid = self.sock.send_code(code, timeout, var)
+        ti = time()
+        reply = None
+        while reply is None:
+            if time() - ti > timeout + 1:
+                self.sock.cancel(rid)
+                raise TimeoutError('No answer from kd5')
+            reply = self.sock.get_reply(rid, timeout=0.05)
+        TRACER.complete('wait reply', ti, rid=rid, var=self.varname)
+
+        if reply['status'] == 'error':
+            raise RuntimeError(reply['error'])
+
+        return reply
+
+    def get(self, start, stop, first=0, last=None):
+        """ Index and values of rows [start, stop) for columns [first, last) """
+
+        index, data = [], []
+        for b in range(start//self.block, (stop - 1)//self.block + 1):
+            key = b, first, last
+            if key not in self.blocks:
+                self.load(self.request(self.code(b*self.block, (b + 1)*self.block, first, last),
+                                       self.timeout, self.var), key)
+            self.blocks.move_to_end(key)
+            lo, hi = max(start - b*self.block, 0), stop - b*self.block
+            block = self.blocks[key]
+            if isinstance(block, pd.DataFrame):
+                block = block.iloc[lo:hi]
+                index += [str(i) for i in block.index]
+                data += block.astype(str).values.tolist()
+            else:
+                index += block[0][lo:hi]
+                data += block[1][lo:hi]
+
+        return index, data
+
+    def to_tsv(self, filename):
+        """ Have the kernel write the whole frame to **filename** """
+
+        code = "_inspect.save_frame({}, '{}')".format(self.varname, filename)
+        self.request(code, self.dump_timeout)
+
+
+def decimate(arr, axis=0, points=100000):
+    """ Strided view of **arr** keeping about **points** values along
+    **axis**, so that plotting a memory-mapped array does not read it all """
+
+    step = max(arr.shape[axis] // points, 1)
+    return arr[(slice(None),) * axis + (slice(None, None, step),)]
+
+
+class Notifier:
+    """ Push the changes of the interactive namespace to kd5 through a Comm.
+
+    After each cell, the namespace summary is compared to the previous one
+    and only the rebound, resized and deleted names are sent, with the same
+    versioned messages as the kd5 stream (see cpyvke.utils.namespace).
+    """
+
+    target = 'cpyvke'
+
+    def __init__(self):
+
+        self.comms = []
+        self.version = 0
+        self.last = {}
+        # Set by the read_only helpers run by kd5
+        self.skip = False
+
+    def register(self):
+        """ Register the Comm target and the post_run_cell hook (once) """
+
+        from IPython import get_ipython
+
+        ip = get_ipython()
+        ip.kernel.comm_manager.register_target(self.target, self.open)
+        if self.notify not in ip.events.callbacks['post_run_cell']:
+            ip.events.register('post_run_cell', self.notify)
+
+    def open(self, comm, msg):
+        """ New kd5 connection : send it the whole namespace """
+
+        comm.on_msg(lambda msg: self.on_msg(comm, msg))
+        comm.on_close(lambda msg: self.close(comm))
+
+        # Bring the other connections up to date first to keep versions
+        self.update()
+        self.comms.append(comm)
+        self.sync(comm)
+
+    def close(self, comm):
+
+        if comm in self.comms:
+            self.comms.remove(comm)
+
+    def on_msg(self, comm, msg):
+        """ kd5 lost a change and asks for the whole namespace """
+
+        if msg['content']['data'].get('sync'):
+            self.sync(comm)
+
+    def sync(self, comm):
+
+        comm.send({'version': self.version, 'full': self.last})
+
+    def update(self):
+        """ Send what changed since the last update """
+
+        summary = summarize_namespace()
+        delta = namespace_delta(self.last, summary)
+        self.last = summary
+
+        if is_empty(delta):
+            return
+
+        self.version += 1
+        for comm in self.comms:
+            comm.send(dict(delta, version=self.version))
+
+    def notify(self, result=None):
+        """ post_run_cell hook. Nothing to do if kd5 is not listening, or
+        after an inspection by kd5. """
+
+        skip, self.skip = self.skip, False
+        if self.comms and not skip:
+            self.update()
+
+
+_notifier = Notifier()
+
+
+def register_comm():
+    """ Let kd5 be notified of the namespace changes. Called by init_kernel """
+
+    _notifier.register()
+
+
 def threaded(func):
     """ Run func in thread """
 
@@ -146,7 +777,7 @@ class Inspect:
             """ Plot 2D variable. """
 
             figure()
-            imshow(self.varval)
+            imshow(decimate(decimate(self.varval, 0, 4000), 1, 4000))
             show()
         except:
             print("ERROR can't display plot")
@@ -156,7 +787,7 @@ class Inspect:
         """ Plot 1D variable. """
         try:
             figure()
-            plot(self.varval)
+            plot(decimate(self.varval))
             show()
         except:
             print("ERROR can't display plot")
@@ -167,7 +798,7 @@ class Inspect:
         try:
             figure()
             for i in range(np.shape(self.varval)[1]):
-                plot(self.varval[:, i])
+                plot(decimate(self.varval[:, i]))
             show()
         except:
             print("ERROR can't display plot")
@@ -178,7 +809,7 @@ class Inspect:
         try:
             figure()
             for i in range(np.shape(self.varval)[0]):
-                plot(self.varval[i, :])
+                plot(decimate(self.varval[i, :]))
             show()
         except:
             print("ERROR can't display plot")
@@ -232,6 +863,8 @@ class Inspect:
             filename = '/tmp/tmp_' + self.varname + '.tsv'
             if os.path.exists(filename):
                 pass
+            elif isinstance(self.varval, FramePager):
+                self.varval.to_tsv(filename)
             else:
                 with open(filename, 'w') as f:
                     f.write(self.varval)
@@ -326,6 +959,10 @@ class Inspect:
 class ProceedInspection:
     """ Object inspection """
 
+    # Time (s) allowed to the kernel to answer
+    timeout = 3
+    summary_timeout = 30
+
     def __init__(self, app, sock, logger, name, value, typ, pos, page):
         """ Class constructor """
 
@@ -338,6 +975,8 @@ class ProceedInspection:
         self.position = pos
         self.page = page
         self.doc = None
+        self.rid = None
+        self.reply = None
 
     def get_variable(self):
         """ Get Variable characteristics. """
@@ -358,7 +997,7 @@ class ProceedInspection:
             self.get_ndarray()
 
         elif self.vartype in ['DataFrame', 'Series', 'Index', 'MultiIndex']:
-            self.get_dataframe()
+            self.get_frame_page()
 
         elif '.' + self.vartype in self.varval:     # Class instance
             self.vartype = 'class'
@@ -375,153 +1014,154 @@ class ProceedInspection:
     def get_function_doc(self):
         """ Get function __doc__ """
 
-        self.filename = '/tmp/tmp_' + self.varname
-        self.code = "with open('{}' , 'w') as fcpyvke0:\n\tfcpyvke0.write(str({}.__doc__))".format(self.filename, self.varname)
+        self.code = "print({}.__doc__)".format(self.varname)
         try:
-            send_msg(self.sock.RequestSock, '<code>' + self.code)
+            self.rid = self.sock.send_code(self.code, self.timeout, self.varname)
             self.logger.debug("Inspecting '{}' with type '{}'".format(self.varname, self.vartype))
             self.wait()
-            with open(self.filename, 'r') as f:
-                self.doc = f.read()
+            self.doc = self.output()
         except Exception:
             self.logger.error('Get traceback', exc_info=True)
             self.kernel_busy()
         else:
             self.logger.debug('kd5 answered : {}'.format(self.varval))
-            os.remove(self.filename)
             self._ismenu = True
 
     def get_function_code(self):
         """ Get function __doc__ """
 
-        self.filename = '/tmp/tmp_' + self.varname
-        self.code = "with open('{}' , 'w') as fcpyvke0:\n\tfcpyvke0.write(str(_inspect.getsource({})))".format(self.filename, self.varname)
+        self.code = "print(_inspect.getsource({}))".format(self.varname)
         self.send_code()
 
     def get_class_instance(self):
         """ Get Class characteristics. """
 
-        self.filename = '/tmp/tmp_' + self.varname
-        self.code = "with open('{}' , 'w') as fcpyvke0:\n\tfcpyvke0.write(str(_inspect.inspect_class_instance({})))".format(self.filename, self.varname)
+        self.code = "print(_inspect.inspect_class_instance({}))".format(self.varname)
         self.send_code()
 
     def get_class(self):
         """ Get Class characteristics. """
 
-        self.filename = '/tmp/tmp_' + self.varname
-        self.code = "with open('{}' , 'w') as fcpyvke0:\n\tfcpyvke0.write(str(_inspect.inspect_class({})))".format(self.filename, self.varname)
+        self.code = "print(_inspect.inspect_class({}))".format(self.varname)
         self.send_code()
 
     def get_module(self):
         """ Get modules characteristics """
 
-        self.filename = '/tmp/tmp_' + self.varname
-        self.code = "with open('{}' , 'w') as fcpyvke0:\n\tfcpyvke0.write(str({}.__name__))".format(self.filename, self.varname)
+        self.code = "print({}.__name__)".format(self.varname)
         self.send_code()
 
     def get_structure(self):
         """ Get Dict/List/Tuple characteristics """
 
-        self.filename = '/tmp/tmp_' + self.varname
-        self.code = "with open('{}' , 'w') as fcpyvke0:\n\tfcpyvke0.write(str({}))".format(self.filename, self.varname)
+        self.code = "print({})".format(self.varname)
         self.send_code()
 
     def get_ndarray(self):
         """ Get ndarray characteristics. """
 
-        self.filename = '/tmp/tmp_' + self.varname + '.npy'
-        code = "_np.save('" + self.filename + "', " + self.varname + ')'
+        mmap_size = int(float(self.app.config['inspect']['mmap-size'])*1024**2)
+        code = "_inspect.share_ndarray('{0}', {0}, {1})".format(self.varname, mmap_size)
         try:
-            send_msg(self.sock.RequestSock, '<code>' + code)
+            self.rid = self.sock.send_code(code, self.timeout)
             self.logger.debug("Name of module '{}' asked to kd5".format(self.varname))
             self.wait()
-            self.varval = np.load(self.filename)
+            with TRACER.span('read', rid=self.rid, var=self.varname):
+                meta = json.loads(self.reply['value'].splitlines()[-1])
+                self.varval = load_ndarray(meta)
         except Exception:
             self.logger.error('Get traceback : ', exc_info=True)
             self.kernel_busy()
         else:
             self.logger.debug('kd5 answered')
-            os.remove(self.filename)
+            if 'shm' in meta:
+                # Mapped : the kernel can free the segment
+                self.sock.run_code("_inspect.release_ndarray('{}')".format(self.varname))
+            elif 'file' in meta:
+                # Mapped files remain readable once removed
+                os.remove(meta['file'])
             self._ismenu = True
 
-    def get_dataframe(self):
-        """ Get pandas characteristics. """
-        
-        self.filename = '/tmp/tmp_' + self.varname + '.tsv'
-        if self.vartype == 'Index':
-            code = f"""
-                column_str = ',\\n'.join([f'  {{col}}' for col in {self.varname}.tolist()])
-                wrapped_str = f"Index([\\n{{column_str}}\\n])"
-                with open('{self.filename}', 'w') as f:
-                    f.write(wrapped_str)
-            """
-        elif self.vartype == 'MultiIndex':
-            code = f"""
-                with open('{self.filename}', 'w') as f:
-                    f.write(str({self.varname}))
-            """
-        else:
-            code = self.varname + ".to_csv('" + self.filename + "', index=True, sep='\t')"
+    def get_frame_page(self):
+        """ Get the number of rows, the columns and the dtypes of a
+        DataFrame/Series/Index. Rows are fetched by the viewer when needed. """
+
+        pager = FramePager(self.sock, self.varname, self.timeout)
         try:
-            send_msg(self.sock.RequestSock, '<code>' + code)
-            self.logger.debug("Name of module '{}' asked to kd5".format(self.varname))
+            self.rid = self.sock.send_code(pager.code(0, 0, 0, 0), self.timeout, pager.var)
+            self.logger.debug("Header of '{}' asked to kd5".format(self.varname))
             self.wait()
+            with TRACER.span('read', rid=self.rid, var=self.varname):
+                pager.load(self.reply)
         except Exception:
             self.logger.error('Get traceback:', exc_info=True)
             self.kernel_busy()
         else:
-            self.logger.debug('kd5 answered')
-            try:
-                with open(self.filename, 'r') as f:
-                    self.varval = f.read()
-                os.remove(self.filename)
-                self._ismenu = True
-            except FileNotFoundError:
-                self.logger.error("File not found: {}".format(self.filename))
-            except Exception as e:
-                self.logger.error("An error occurred while processing file: {}".format(e))
-            # with open(self.filename, 'r') as f: self.varval = f.read()
-            # os.remove(self.filename)
-            # self._ismenu = True
+            self.logger.debug('kd5 answered : {}'.format(pager))
+            self.varval = pager
+            self._ismenu = True
 
+    def get_summary(self):
+        """ Get summary statistics computed by the kernel """
+
+        try:
+            self.rid = self.sock.send_code("_inspect.describe({})".format(self.varname),
+                                           self.summary_timeout, self.varname)
+            self.logger.debug("Summary of '{}' asked to kd5".format(self.varname))
+            self.wait(self.summary_timeout)
+            with TRACER.span('read', rid=self.rid, var=self.varname):
+                summary = json.loads(self.reply['value'].splitlines()[-1])
+        except Exception:
+            self.logger.error('Get traceback:', exc_info=True)
+            self.kernel_busy()
+        else:
+            self.logger.debug('kd5 answered : {}'.format(summary))
+            return summary
 
     def get_help(self):
         """ Help item in menu """
 
         if self.vartype == 'function':
-            self.filename = '/tmp/tmp_' + self.varname
-            self.code = "with open('{}' , 'w') as fcpyvke0:\n\tfcpyvke0.write(str({}.__doc__))".format(self.filename, self.varname)
+            self.code = "print({}.__doc__)".format(self.varname)
             self.send_code()
 
     def send_code(self):
         """ Send code to kernel and except answer ! """
 
         try:
-            send_msg(self.sock.RequestSock, '<code>' + self.code)
+            self.rid = self.sock.send_code(self.code, self.timeout, self.varname)
             self.logger.debug("Inspecting '{}' with type '{}'".format(self.varname, self.vartype))
             self.wait()
-            with open(self.filename, 'r') as f:
+            with TRACER.span('read', rid=self.rid, var=self.varname):
                 if self.vartype in ['str', 'function', 'module', 'builtin_function_or_method']:
-                    self.varval = f.read()
+                    self.varval = self.output()
                 else:
-                    self.varval = eval(f.read())
+                    self.varval = eval(self.output())
         except Exception:
             self.logger.error('Get traceback', exc_info=True)
             self.kernel_busy()
         else:
             self.logger.debug('kd5 answered : {}'.format(self.varval))
-            os.remove(self.filename)
             self._ismenu = True
 
+    def output(self):
+        """ What the code printed (without the last newline) """
+
+        value = self.reply['value']
+        return value[:-1] if value.endswith('\n') else value
+
     def kernel_busy(self):
         """ Handle silent kernel. """
 
-        self.app.wng.display('Kernel Busy ! Try again...')
+        if self.reply and self.reply['status'] == 'error':
+            self.app.wng.display(self.reply['error'])
+        else:
+            self.app.wng.display('Kernel Busy ! Try again...')
         self.varval = '[Busy]'
         self._ismenu = False
 
-    def wait(self):
-        """ Wait for variable value. """
+    def wait(self, timeout=None):
+        """ Wait for the reply of kd5 to the last request. """
 
         i, j = 0, 0
         spinner = [['.', 'o', 'O', 'o'],
@@ -551,7 +1191,8 @@ class ProceedInspection:
         search = spinner[21]
         spinner = spinner[19]
         ti = time()
-        while os.path.exists(self.filename) is False:
+        self.reply = None
+        while self.reply is None:
             self.app.stdscr.addstr(self.position + 1 - (self.page-1)*self.app.row_max, 1,
                                    spinner[i], self.app.c_exp_txt | curses.A_BOLD)
             self.app.stdscr.addstr(self.app.screen_height - 1, 0,
@@ -568,9 +1209,16 @@ class ProceedInspection:
             else:
                 j = 0
 
-            if time() - ti > 3:
+            # The daemon should have answered (timeout error) : give up
+            if time() - ti > (timeout or self.timeout) + 1:
+                self.sock.cancel(self.rid)
                 break
 
-            sleep(0.05)
+            self.reply = self.sock.get_reply(self.rid, timeout=0.05)
+
+        TRACER.complete('wait reply', ti, rid=self.rid, var=self.varname)
+
+        if self.reply and self.reply['status'] == 'error':
+            self.logger.error('kd5 replied : {}'.format(self.reply['error']))
 
         self.app.stdscr.refresh()
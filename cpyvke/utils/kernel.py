@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : Fri Nov 4 21:49:15 2016
-# Last Modified : mer. 28 mars 2018 23:08:44 CEST
+# Last Modified : dim. 18 oct. 2026 16:05:12 CEST
 """
 -----------
 DOCSTRING
@@ -242,6 +242,23 @@ def connect_kernel(cf):
     return km, kc
 
 
+async def async_connect_kernel(cf):
+    """ Connect a kernel with an asynchronous client (used by kd5). """
+
+    if is_runing(cf):
+        km = None
+    else:
+        km = manager.AsyncKernelManager(connection_file=cf)
+        await km.start_kernel()
+
+    kc = AsyncKernelClient(connection_file=cf)
+    kc.load_connection_file(cf)
+    kc.start_channels()
+    init_kernel(kc)
+
+    return km, kc
+
+
 async def connect_kernel_as_manager(cf):
     """ Connect a kernel """
 
@@ -262,11 +279,13 @@ def init_kernel(kc, backend='tk'):
 
     backend = 'tk'
 
-    kc.execute("import numpy as _np", store_history=False)
-    kc.execute("import pandas as _pd", store_history=False)
-    kc.execute("_np.set_printoptions(threshold={})".format(sys.maxsize), store_history=False)
-    kc.execute("%matplotlib {}".format(backend), store_history=False)
-    kc.execute("import cpyvke.utils.inspector as _inspect", store_history=False)
+    # Do not abort the queue if one of these fails (e.g. missing backend)
+    kc.execute("import numpy as _np", store_history=False, stop_on_error=False)
+    kc.execute("import pandas as _pd", store_history=False, stop_on_error=False)
+    kc.execute("_np.set_printoptions(threshold={})".format(sys.maxsize), store_history=False, stop_on_error=False)
+    kc.execute("%matplotlib {}".format(backend), store_history=False, stop_on_error=False)
+    kc.execute("import cpyvke.utils.inspector as _inspect", store_history=False, stop_on_error=False)
+    kc.execute("_inspect.register_comm()", store_history=False, stop_on_error=False)
 
 
 def find_and_kill_ipykernel_launcher(cmd):
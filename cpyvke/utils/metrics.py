@@ -0,0 +1,192 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016-2018 Cyril Desjouy <ipselium@free.fr>
+#
+# This file is part of cpyvke
+#
+# cpyvke is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cpyvke is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cpyvke. If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Creation Date : lun. 19 oct. 2026 00:41:17 CEST
+# Last Modified : lun. 19 oct. 2026 00:41:17 CEST
+"""
+-----------
+DOCSTRING
+
+Metrics of kd5, exposed in the Prometheus text format (version 0.0.4).
+
+Counters and histograms are updated by kd5 as it runs. Gauges are read
+from a function when the metrics are collected. Each metric may have
+labels, given as keyword arguments :
+
+    REQUESTS = registry.counter('kd5_requests_total', 'Requests', ['type'])
+    REQUESTS.inc(type='code')
+
+@author: Cyril Desjouy
+"""
+
+import bisect
+
+
+# Default histogram buckets (s)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Buckets for sizes (bytes)
+SIZE_BUCKETS = tuple(4**n for n in range(4, 14))
+
+
+def format_labels(names, values, extra=()):
+    """ Labels of a sample : {name="value",...} """
+
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+
+    escape = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in pairs) + '}'
+
+
+def format_value(value):
+
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """ Base class of metrics : values by label values """
+
+    kind = None
+
+    def __init__(self, name, doc, labels=()):
+
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def key(self, labels):
+
+        if set(labels) != set(self.labels):
+            raise ValueError('{} expects labels {}'.format(self.name, self.labels))
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """ (suffix, label values, extra labels, value) of each sample """
+
+        for key, value in sorted(self.values.items()):
+            yield '', key, (), value
+
+    def render(self):
+
+        lines = ['# HELP {} {}'.format(self.name, self.doc),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for suffix, key, extra, value in self.samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, format_labels(self.labels, key, extra),
+                                            format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """ Value that only goes up """
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """ Value read from **func** (returning {label values: value}, or a
+    value if the gauge has no label) when the metrics are collected """
+
+    kind = 'gauge'
+
+    def __init__(self, name, doc, func, labels=()):
+
+        super().__init__(name, doc, labels)
+        self.func = func
+
+    def samples(self):
+
+        values = self.func()
+        if not self.labels:
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            yield '', tuple(str(v) for v in (key if isinstance(key, tuple) else (key,))), (), value
+
+
+class Histogram(Metric):
+    """ Distribution of observed values """
+
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=BUCKETS):
+
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+
+        key = self.key(labels)
+        if key not in self.values:
+            self.values[key] = {'counts': [0]*len(self.buckets), 'sum': 0, 'count': 0}
+
+        state = self.values[key]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state['counts'][index] += 1
+        state['sum'] += value
+        state['count'] += 1
+
+    def samples(self):
+
+        for key, state in sorted(self.values.items()):
+            cumulated = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulated += count
+                yield '_bucket', key, (('le', format_value(float(bound))),), cumulated
+            yield '_bucket', key, (('le', '+Inf'),), state['count']
+            yield '_sum', key, (), state['sum']
+            yield '_count', key, (), state['count']
+
+
+class Registry:
+    """ Set of metrics, rendered together """
+
+    def __init__(self):
+
+        self.metrics = []
+
+    def add(self, metric):
+
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self.add(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, func, labels=()):
+        return self.add(Gauge(name, doc, func, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=BUCKETS):
+        return self.add(Histogram(name, doc, labels, buckets))
+
+    def render(self):
+        """ All the metrics in the Prometheus text format """
+
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016-2018 Cyril Desjouy <ipselium@free.fr>
+#
+# This file is part of cpyvke
+#
+# cpyvke is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cpyvke is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cpyvke. If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Creation Date : dim. 18 oct. 2026 10:12:31 CEST
+# Last Modified : dim. 18 oct. 2026 19:12:40 CEST
+"""
+-----------
+DOCSTRING
+
+Namespace snapshots exchanged between kd5 and its clients.
+
+kd5 keeps the last snapshot of the namespace of each kernel it watches and
+only streams what changed since the previous one. Each message carries the
+kernel id and a version number :
+
+    * {'kernel': kid, 'version': n, 'full': {name: entry}}
+    * {'kernel': kid, 'version': n, 'added': {name: entry},
+       'changed': {name: entry}, 'removed': [name]}
+
+@author: Cyril Desjouy
+"""
+
+
+def namespace_delta(old, new):
+    """ Return the added, changed and removed entries between two snapshots """
+
+    added = {name: new[name] for name in new if name not in old}
+    changed = {name: new[name] for name in new
+               if name in old and new[name] != old[name]}
+    removed = [name for name in old if name not in new]
+
+    return {'added': added, 'changed': changed, 'removed': removed}
+
+
+def is_empty(delta):
+    """ Check if a delta actually contains something """
+
+    return not (delta['added'] or delta['changed'] or delta['removed'])
+
+
+def full_msg(kid, version, snapshot):
+    """ Message containing the whole snapshot of kernel **kid** """
+
+    return {'kernel': kid, 'version': version, 'full': snapshot}
+
+
+def delta_msg(kid, version, delta):
+    """ Message containing a delta of kernel **kid** """
+
+    return dict(delta, kernel=kid, version=version)
+
+
+class Namespace:
+    """ Client side copy of the namespace streamed by kd5. """
+
+    def __init__(self):
+
+        self.version = None
+        self.items = {}
+
+    def update(self, data):
+        """ Apply a (decoded) message from kd5.
+
+        Return False if a delta is missing, i.e. if the client has to ask
+        kd5 for a full snapshot.
+        """
+
+        if 'full' in data:
+            self.items = data['full']
+
+        elif self.version is None or data['version'] != self.version + 1:
+            return False
+
+        else:
+            for name in data['removed']:
+                self.items.pop(name, None)
+            self.items.update(data['added'])
+            self.items.update(data['changed'])
+
+        self.version = data['version']
+
+        return True
+
+
+class Namespaces(dict):
+    """ Client side copies of the namespaces of all the kernels watched by
+    kd5, by kernel id. """
+
+    def __missing__(self, kid):
+
+        self[kid] = Namespace()
+
+        return self[kid]
+
+    def apply(self, data):
+        """ Dispatch a (decoded) message from kd5 to the namespace of its
+        kernel.
+
+        Return the kernel id and False if a full snapshot is needed.
+        """
+
+        return data['kernel'], self[data['kernel']].update(data)
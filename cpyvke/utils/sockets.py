@@ -20,7 +20,7 @@
 #
 #
 # Creation Date : jeu. 15 mars 2018 18:07:10 CET
-# Last Modified : dim. 25 mars 2018 21:21:36 CEST
+# Last Modified : lun. 19 oct. 2026 12:10:53 CEST
 """
 -----------
 DOCSTRING
@@ -28,8 +28,17 @@ DOCSTRING
 @author: Cyril Desjouy
 """
 
+import time
+import select
 import socket
-from cpyvke.utils.comm import send_msg
+from cpyvke.utils import comm
+from cpyvke.utils.comm import send_frame, socket_path, FrameReader
+from cpyvke.utils.namespace import Namespaces
+from cpyvke.utils.trace import TRACER
+
+
+# Pings the daemon may leave unanswered before being considered disconnected
+HEARTBEAT_MISSES = 3
 
 
 class SocketManager:
@@ -39,30 +48,58 @@ class SocketManager:
         self.config = config
         self.logger = logger
         self.connected = False
+        self.heartbeat = float(self.config['comm']['heartbeat'])
+        self.namespaces = Namespaces()
+        self.watched = set()
+        self.request_id = 0
+        self.replies = {}
+        # Requests given up on : their reply is dropped
+        self.cancelled = set()
         self.init_sockets()
 
+    def connect(self, name, port):
+        """ Connect to the daemon socket **name** (stream|request) """
+
+        if self.config['comm']['transport'] == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(socket_path(name))
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect(("localhost", port))
+
+        return sock
+
+    def hello(self, sock):
+        """ Tell the daemon which compressed frames can be read """
+
+        if self.config['comm']['compression'] == 'True':
+            send_frame(sock, comm.HELLO, {'codecs': list(comm.CODECS)})
+
     def init_main_socket(self):
         """ Init Main Socket. """
 
         try:
-            hote = "localhost"
             sport = int(self.config['comm']['s-port'])
-            self.MainSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.MainSock.connect((hote, sport))
+            self.MainSock = self.connect('stream', sport)
+            self.hello(self.MainSock)
             self.MainSock.setblocking(0)
+            self.MainReader = FrameReader(self.MainSock)
+            # A successful connection counts as an answered ping
+            self.last_pong = time.monotonic()
+            self.connected = True
             self.logger.debug('Connected to main socket')
-        except ConnectionRefusedError:
+        except (ConnectionRefusedError, FileNotFoundError):
             self.logger.error('Connection to stream socket failed ')
 
     def init_request_socket(self):
         """ Init Request Socket. """
 
         try:
-            hote = "localhost"
             rport = int(self.config['comm']['r-port'])
-            self.RequestSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.RequestSock.connect((hote, rport))
+            self.RequestSock = self.connect('request', rport)
+            self.hello(self.RequestSock)
             self.RequestSock.setblocking(0)
+            self.RequestReader = FrameReader(self.RequestSock)
             self.logger.debug('Connected to request socket')
         except Exception:
             self.logger.error('Connection to stream socket failed : \n', exc_info=True)
@@ -70,6 +107,8 @@ class SocketManager:
     def init_sockets(self):
         """ Init all sockets """
 
+        self.watched = set()
+        self.last_ping = self.last_pong = float('-inf')
         self.init_main_socket()
         self.init_request_socket()
 
@@ -106,15 +145,26 @@ class SocketManager:
         self.init_sockets()
 
     def check_main_socket(self):
-        """ Test if connection to daemon is alive. """
+        """ Heartbeat : ping the daemon every **heartbeat** seconds. The
+        connection is alive as long as one of the last pings was answered.
+        Cheap enough to be called at each refresh of the UI. """
 
-        try:
-            send_msg(self.MainSock, '<TEST>')
-            self.connected = True
-        except BlockingIOError:
-            self.connected = True
-        except OSError:
-            self.connected = False
+        now = time.monotonic()
+
+        # Waiting for a pong
+        if self.last_pong < self.last_ping:
+            self.fetch_variables()
+
+        if now - self.last_ping >= self.heartbeat:
+            self.last_ping = now
+            try:
+                send_frame(self.MainSock, comm.PING)
+            except BlockingIOError:
+                pass
+            except (OSError, AttributeError):
+                self.last_pong = float('-inf')
+
+        self.connected = now - self.last_pong < HEARTBEAT_MISSES*self.heartbeat
 
     def warning_socket(self, wng):
         """ Check connection and display warning. """
@@ -128,15 +178,130 @@ class SocketManager:
     def force_update(self, wng):
         """ Force update of variable list sending fake code to Daemon """
 
-        send_msg(self.RequestSock, '<code> ')
+        send_frame(self.RequestSock, comm.CODE, {'code': ' '})
         wng.display('Reloading Variable List...')
 
+    def sync_variables(self, kid=None):
+        """ Ask Daemon for the whole variable list of kernel **kid** (all
+        kernels by default) """
+
+        try:
+            send_frame(self.RequestSock, comm.SYNC, {'kernel': kid})
+        except Exception:
+            self.logger.error('Sync variable list :', exc_info=True)
+
+    def watch_kernel(self, cf):
+        """ Ask Daemon to watch kernel **cf** too """
+
+        if cf in self.watched:
+            return
+
+        try:
+            send_frame(self.RequestSock, comm.WATCH, {'cf': cf})
+        except Exception:
+            self.logger.error('Watch kernel :', exc_info=True)
+        else:
+            self.watched.add(cf)
+
+    def fetch_variables(self):
+        """ Apply the variable changes streamed by the daemon """
+
+        while True:
+            try:
+                frame = self.MainReader.recv()
+            except BlockingIOError:     # If no message !
+                break
+            except OSError:             # If user disconnect cpyvke from socket
+                break
+            except AttributeError:      # If kd5 is stopped
+                break
+
+            if frame is None:
+                break
+            if frame.type == comm.PONG:
+                self.last_pong = time.monotonic()
+            if frame.type != comm.NAMESPACE:
+                continue
+
+            kid, updated = self.namespaces.apply(frame.body)
+            if updated:
+                self.logger.info('Variable list of {} updated (v{})'.format(kid, self.namespaces[kid].version))
+                self.logger.debug('\n%s', frame.body)
+            else:
+                self.logger.info('Variable list of {} out of sync. Asking kd5...'.format(kid))
+                self.sync_variables(kid)
+                break
+
+    def send_code(self, code, timeout=None, var=None):
+        """ Send code to the kernel. Return the id of the request.
+        If **timeout** is given, the daemon gives up after timeout seconds.
+        If the code inspects variable **var** (and has no side effect), the
+        daemon may answer with the reply it kept from the last time. """
+
+        self.request_id += 1
+        with TRACER.span('send', rid=self.request_id, var=var):
+            send_frame(self.RequestSock, comm.CODE, {'code': code, 'timeout': timeout, 'var': var},
+                       self.request_id)
+
+        return self.request_id
+
+    def cancel(self, rid):
+        """ Stop waiting for request **rid** (the kernel is interrupted if it
+        is running it) """
+
+        if self.replies.pop(rid, None) is None:
+            self.cancelled.add(rid)
+
+        try:
+            send_frame(self.RequestSock, comm.CANCEL, rid=rid)
+        except Exception:
+            self.logger.error('Cancel request :', exc_info=True)
+
+    def get_reply(self, rid, timeout=0):
+        """ Reply of the daemon to request **rid**. None if not arrived
+        within **timeout** seconds. Other replies are kept for later. """
+
+        if rid not in self.replies:
+            try:
+                select.select([self.RequestSock], [], [], timeout)
+            except (OSError, ValueError, AttributeError):
+                return None
+
+        while True:
+            try:
+                frame = self.RequestReader.recv()
+            except (BlockingIOError, OSError, AttributeError):
+                break
+            if frame is None:
+                break
+            if frame.id in self.cancelled:
+                self.cancelled.discard(frame.id)
+            else:
+                self.replies[frame.id] = dict(frame.body, id=frame.id)
+
+        return self.replies.pop(rid, None)
+
+    def run_code(self, code):
+        """ Send code to the kernel without asking for a reply """
+
+        send_frame(self.RequestSock, comm.CODE, {'code': code})
+
+    def connect_kernel(self, cf):
+        """ Ask Daemon to connect this client to kernel **cf** """
+
+        send_frame(self.RequestSock, comm.CONNECT, {'cf': cf})
+
+    def stop_daemon(self):
+        """ Ask Daemon to stop """
+
+        send_frame(self.RequestSock, comm.STOP)
+
     def del_var(self, varname, wng):
         """ Delete a variable from kernel. """
 
         code = 'del {}'.format(varname)
         try:
-            send_msg(self.RequestSock, '<code>' + code)
+            send_frame(self.RequestSock, comm.CODE, {'code': code})
             self.logger.debug("Send delete signal for variable {}".format(varname))
         except Exception:
             self.logger.error('Delete variable :', exc_info=True)
@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2016-2018 Cyril Desjouy <ipselium@free.fr>
+#
+# This file is part of cpyvke
+#
+# cpyvke is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cpyvke is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cpyvke. If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Creation Date : lun. 19 oct. 2026 01:18:52 CEST
+# Last Modified : lun. 19 oct. 2026 01:18:52 CEST
+"""
+-----------
+DOCSTRING
+
+Tracing of the inspection requests, in the Chrome trace format (JSON array
+of events), readable with chrome://tracing or https://ui.perfetto.dev.
+
+cpyvke and kd5 append their spans to the same file (one event per line) :
+wall clock timestamps put the spans of both processes on a single timeline,
+and the request id (rid) links the spans of a request. Nothing is written
+unless the tracer is started :
+
+    TRACER.start(path, 'kd5')
+    with TRACER.span('request', rid=3) as args:
+        args['cached'] = True
+
+@author: Cyril Desjouy
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Tracer:
+    """ Write spans to a Chrome trace file """
+
+    def __init__(self):
+
+        self.file = None
+        self.cat = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+
+        return self.file is not None
+
+    def start(self, path, process):
+        """ Append the spans of this process (named **process**) to **path** """
+
+        self.file = open(path, 'a', buffering=1)
+        self.cat = process
+        with self.lock:
+            # The closing bracket of the array is optional
+            if self.file.tell() == 0:
+                self.file.write('[\n')
+        self.write({'name': 'process_name', 'ph': 'M', 'args': {'name': process}})
+
+    def stop(self):
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def write(self, event):
+
+        event.update(pid=os.getpid(), tid=threading.get_native_id())
+        with self.lock:
+            if self.file is not None:
+                self.file.write(json.dumps(event, default=str) + ',\n')
+
+    def complete(self, name, start, end=None, **args):
+        """ Span **name** from **start** to **end** (now by default), times
+        given by time.time() """
+
+        if self.file is None:
+            return
+
+        end = time.time() if end is None else end
+        self.write({'name': name, 'cat': self.cat, 'ph': 'X', 'ts': start*1e6,
+                    'dur': (end - start)*1e6, 'args': args})
+
+    @contextmanager
+    def span(self, name, **args):
+        """ Span covering the with block. Yield the arguments of the span,
+        that may be completed in the block. """
+
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.complete(name, start, **args)
+
+
+TRACER = Tracer()
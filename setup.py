@@ -52,6 +52,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=list_install_requires,
+    extras_require={'arrow': ['pyarrow']},
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
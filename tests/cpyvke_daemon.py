@@ -35,8 +35,6 @@ import logging
 from cpyvke.utils.sockets import SocketManager
 from cpyvke.utils.config import cfg_setup
 from logging.handlers import RotatingFileHandler
-from cpyvke.utils.comm import recv_msg
-from cpyvke.utils.display import whos_to_dic
 
 cfg = cfg_setup()
 config = cfg.run()
@@ -60,36 +58,16 @@ logger.addHandler(handler)
 sock = SocketManager(config, logger)
 
 while True:
-    # Check Connection to daemon
-
+    # Check Connection to daemon (heartbeat)
     sock.check_main_socket()
 
     if not sock.connected:
         time.sleep(1)
-        while not sock.connected:
-            try:
-                sock.init_sockets()
-            except Exception:
-                logger.error('Connection to stream socket failed : \n', exc_info=True)
-            else:
-                sock.connected = True
+        try:
+            sock.restart_sockets()
+        except Exception:
+            logger.error('Connection to stream socket failed : \n', exc_info=True)
 
     else:
-        try:
-            tmp = recv_msg(sock.MainSock).decode('utf8')
-        except BlockingIOError:     # If no message !
-            pass
-        except OSError:             # If user disconnect cpyvke from socket
-            pass
-        except AttributeError:      # If kd5 is stopped
-            pass
-        else:
-            if tmp:
-                lst = whos_to_dic(tmp)
-                logger.info('Variable list updated')
-                logger.debug('\n%s', tmp)
-                try:
-                    # remove temporary file used by daemon from the list
-                    del lst['fcpyvke0']
-                except KeyError:
-                    pass
+        sock.fetch_variables()
+        time.sleep(0.1)